@@ -0,0 +1,45 @@
+#!/usr/bin/env python
+
+"""Compares two benchmark result files saved by run.py."""
+
+import argparse
+import json
+import sys
+from typing import Dict, List, Tuple
+
+
+def compare(baseline: Dict, current: Dict, threshold: float = 0.1) -> List[Tuple]:
+    """
+    Compare the benchmarks present in both result files.
+    Arguments:
+        baseline  : results loaded from the earlier run
+        current   : results loaded from the later run
+        threshold : (optional) relative slowdown reported as a regression
+    Returns:
+        list of (name, baseline seconds, current seconds, ratio, regressed)
+    """
+    before = {result['name']: result for result in baseline['results']}
+    ret = []
+    for result in current['results']:
+        if result['name'] in before:
+            old = before[result['name']]['seconds']
+            new = result['seconds']
+            ratio = new / old if old > 0 else float('inf')
+            ret.append((result['name'], old, new, ratio, ratio > 1 + threshold))
+    return ret
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('baseline', help='results of the earlier run')
+    parser.add_argument('current', help='results of the later run')
+    parser.add_argument('--threshold', type=float, default=0.1,
+                        help='relative slowdown reported as a regression')
+    args = parser.parse_args()
+    with open(args.baseline, encoding='UTF8') as baseline_file, \
+            open(args.current, encoding='UTF8') as current_file:
+        rows = compare(json.load(baseline_file), json.load(current_file), args.threshold)
+    for name, old, new, ratio, regressed in rows:
+        print('%-45s %10.4fs %10.4fs %7.2fx%s' % (name, old, new, ratio,
+                                                  '  REGRESSION' if regressed else ''))
+    sys.exit(1 if any(row[4] for row in rows) else 0)
@@ -0,0 +1,90 @@
+#!/usr/bin/env python
+
+"""Generates synthetic weather csv files for benchmarks."""
+
+import argparse
+import csv
+import datetime
+import random
+from pathlib import Path
+from typing import Dict, Iterator, List
+
+WEATHER_FILE = Path(__file__).resolve().parent.parent / 'examples' / 'weather.csv'
+
+FIELD_NAMES = [
+    'Data.Precipitation', 'Date.Full', 'Date.Month', 'Date.Week of', 'Date.Year',
+    'Station.City', 'Station.Code', 'Station.Location', 'Station.State',
+    'Data.Temperature.Avg Temp', 'Data.Temperature.Max Temp',
+    'Data.Temperature.Min Temp', 'Data.Wind.Direction', 'Data.Wind.Speed'
+]
+
+STATION_FIELDS = ['Station.City', 'Station.Code', 'Station.Location', 'Station.State']
+
+
+def stations() -> List[Dict]:
+    """
+    Return the distinct stations in examples/weather.csv.
+    """
+    with open(WEATHER_FILE, encoding='UTF8', newline='') as input_file:
+        seen = {}
+        for record in csv.DictReader(input_file):
+            station = tuple(record[field] for field in STATION_FIELDS)
+            seen.setdefault(station, dict(zip(STATION_FIELDS, station)))
+    return list(seen.values())
+
+
+def records(rows: int, seed: int = 0) -> Iterator[Dict]:
+    """
+    Generate weather records with the fields and value ranges of examples/weather.csv.
+    Arguments:
+        rows : number of records
+        seed : (optional) random seed.  The same seed generates the same records.
+    """
+    rng = random.Random(seed)
+    all_stations = stations()
+    start = datetime.date(2016, 1, 3)
+    for i in range(rows):
+        station = all_stations[i % len(all_stations)]
+        date = start + datetime.timedelta(weeks=i // len(all_stations) % 520)
+        avg = round(rng.gauss(55, 20))
+        spread = abs(round(rng.gauss(10, 4)))
+        record = {
+            'Data.Precipitation': str(round(max(0.0, rng.gauss(0, 1.5)), 2)),
+            'Date.Full': date.isoformat(),
+            'Date.Month': str(date.month),
+            'Date.Week of': str(date.day),
+            'Date.Year': str(date.year),
+            'Data.Temperature.Avg Temp': str(avg),
+            'Data.Temperature.Max Temp': str(avg + spread),
+            'Data.Temperature.Min Temp': str(avg - spread),
+            'Data.Wind.Direction': str(rng.randrange(36)),
+            'Data.Wind.Speed': str(round(abs(rng.gauss(7, 4)), 2))
+        }
+        record.update(station)
+        yield record
+
+
+def generate(path: str, rows: int, seed: int = 0) -> str:
+    """
+    Write a synthetic weather csv file, quoted like examples/weather.csv.
+    Arguments:
+        path : path of the file to write
+        rows : number of records
+        seed : (optional) random seed
+    Returns:
+        path
+    """
+    with open(path, 'w', encoding='UTF8', newline='') as output_file:
+        writer = csv.DictWriter(output_file, fieldnames=FIELD_NAMES, quoting=csv.QUOTE_ALL)
+        writer.writeheader()
+        writer.writerows(records(rows, seed))
+    return path
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('path', help='csv file to write')
+    parser.add_argument('--rows', type=int, default=100000, help='number of records')
+    parser.add_argument('--seed', type=int, default=0, help='random seed')
+    args = parser.parse_args()
+    generate(args.path, args.rows, args.seed)
@@ -0,0 +1,281 @@
+#!/usr/bin/env python
+
+"""Times the parse, filter, csv and statistics hot paths on synthetic data."""
+
+import argparse
+import csv
+import datetime
+import fnmatch
+import json
+import os
+import platform
+import resource
+import subprocess
+import sys
+import tempfile
+import time
+import tracemalloc
+from itertools import islice
+from pathlib import Path
+from typing import Callable, Dict, List
+
+sys.path.insert(0, str(Path(__file__).resolve().parent.parent))
+sys.path.insert(0, str(Path(__file__).resolve().parent))
+
+import numpy as np  # noqa: E402
+from dicter.csv_filter import CSV_filter  # noqa: E402
+from dicter.filter import apply  # noqa: E402
+from dicter.parser import parse  # noqa: E402
+from dicter.stats import Stats  # noqa: E402
+from generate import generate, stations  # noqa: E402
+
+CITIES = sorted({station['Station.City'] for station in stations()})
+
+
+def _deep(op: str, depth: int, leaf: Callable[[int], Dict]) -> Dict:
+    """
+    Return a filter nesting op depth levels deep, with two leaves per level.
+    """
+    if depth == 0:
+        return leaf(0)
+    return {op: [leaf(depth), _deep(op, depth - 1, leaf)]}
+
+
+FILTERS = {
+    'shallow_and': {'$and': [{'$gt': {'Data.Temperature.Max Temp': 60}},
+                             {'$lt': {'Data.Wind.Speed': 10}}]},
+    'shallow_or': {'$or': [{'Station.State': 'Arizona'},
+                           {'$lt': {'Data.Temperature.Min Temp': 0}}]},
+    'deep_and': _deep('$and', 12, lambda i: {'$gt': {'Data.Temperature.Max Temp': i - 50}}),
+    'deep_or': _deep('$or', 12, lambda i: {'Station.City': CITIES[i]}),
+    'regex': {'$or': [{'$re': {'Station.City': r'S[a-z]+ '}},
+                      {'$re': {'Station.Location': r'.*, (CA|NV)$'}}]},
+    'in': {'$in': {'Station.City': CITIES[::3]}},
+}
+
+# Records per chunk in the chunked apply and csv benchmarks.
+CHUNK_SIZE = 8192
+
+# Stats methods timed on a column that has already been extracted.
+STATS_METHODS = ['mean', 'min', 'max', 'std', 'median', 'sum', 'percentiles', 'n', 'summary']
+
+
+# Default maximum number of records loaded into memory by the in-memory benchmarks.
+DEFAULT_MEMORY_ROWS = 1000000
+
+
+class Benchmark:
+    """
+    A named operation over rows records, timed by measure.
+    """
+
+    def __init__(self, name: str, rows: int, setup: Callable[[], object],
+                 run: Callable[[object], object]) -> None:
+        self.name = name
+        self.rows = rows
+        self.setup = setup
+        self.run = run
+
+
+def _loader(csv_path: str, limit: int) -> Callable[[], List[Dict]]:
+    """
+    Return a function that reads the first limit records of csv_path once and
+    then returns them again on each call.
+    """
+    loaded = []
+
+    def load() -> List[Dict]:
+        if not loaded:
+            with open(csv_path, encoding='UTF8', newline='') as input_file:
+                loaded.append(list(islice(csv.DictReader(input_file), limit)))
+        return loaded[0]
+    return load
+
+
+def benchmarks(csv_path: str, rows: int, out_dir: str,
+               memory_rows: int = DEFAULT_MEMORY_ROWS) -> List[Benchmark]:
+    """
+    Return the benchmarks over the synthetic csv file at csv_path.
+
+    The csv benchmarks read the whole file, so their times include reading
+    it.  The other benchmarks work on records already in memory, loaded
+    in their setup from the first memory_rows records of the file.
+    """
+    load = _loader(csv_path, memory_rows)
+    in_memory = min(rows, memory_rows)
+    ret = []
+    for name, dct in FILTERS.items():
+        ret.append(Benchmark('parse.' + name, 1, lambda: None,
+                             lambda _, dct=dct: parse(dct)))
+        ret.append(Benchmark('matches.' + name, in_memory,
+                             lambda dct=dct: (load(), parse(dct)),
+                             lambda state: [r for r in state[0] if state[1].matches(r)]))
+        ret.append(Benchmark('apply.' + name, in_memory, load,
+                             lambda records, dct=dct: apply(dct, records)))
+        ret.append(Benchmark('apply_chunked.' + name, in_memory, load,
+                             lambda records, dct=dct: apply(dct, records,
+                                                            chunk_size=CHUNK_SIZE)))
+    out_path = os.path.join(out_dir, 'out.csv')
+    for name in ('shallow_and', 'regex'):
+        dct = FILTERS[name]
+        ret.append(Benchmark('csv.write_filtered_file.' + name, rows, lambda: None,
+                             lambda _, dct=dct: CSV_filter(csv_path, out_path)
+                             .write_filtered_file(dct)))
+        ret.append(Benchmark('csv.stream_filtered_file.' + name, rows, lambda: None,
+                             lambda _, dct=dct: CSV_filter(csv_path, out_path)
+                             .stream_filtered_file(dct)))
+        ret.append(Benchmark('csv.stream_chunked.' + name, rows, lambda: None,
+                             lambda _, dct=dct: CSV_filter(csv_path, out_path,
+                                                           chunk_size=CHUNK_SIZE)
+                             .stream_filtered_file(dct)))
+    key = 'Data.Temperature.Max Temp'
+    ret.append(Benchmark('stats.data', in_memory, lambda: Stats(load(), key),
+                         lambda stats: (stats.invalidate(), stats.data())))
+
+    def extracted() -> Stats:
+        stats = Stats(load(), key)
+        stats.data()
+        return stats
+    for method in STATS_METHODS:
+        ret.append(Benchmark('stats.' + method, in_memory, extracted,
+                             lambda stats, method=method: getattr(stats, method)()))
+    ret.append(Benchmark('stats.percentile', in_memory, extracted,
+                         lambda stats: stats.percentile(90)))
+    return ret
+
+
+def _rss_kb() -> int:
+    """
+    Return the current resident set size of this process in KiB, or None if unknown.
+    """
+    try:
+        with open('/proc/self/statm', encoding='ascii') as statm:
+            return int(statm.read().split()[1]) * os.sysconf('SC_PAGE_SIZE') // 1024
+    except (OSError, ValueError):
+        return None
+
+
+def _peak_rss_kb() -> int:
+    """
+    Return the peak resident set size of this process in KiB.
+    """
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    return peak // 1024 if sys.platform == 'darwin' else peak
+
+
+def measure(benchmark: Benchmark, repeat: int) -> Dict:
+    """
+    Time benchmark and measure its memory use.
+    Returns:
+        dictionary of results.  seconds is the best of repeat runs.  peak_rss_kb
+        is the peak of the whole process, so measure should run in a fresh
+        process for each benchmark, as run_all does; setup_rss_kb is the resident
+        size once the benchmark is set up, e.g. with its records loaded.
+    """
+    times = []
+    setup_rss = None
+    for _ in range(repeat):
+        state = benchmark.setup()
+        setup_rss = _rss_kb() if setup_rss is None else setup_rss
+        start = time.perf_counter()
+        benchmark.run(state)
+        times.append(time.perf_counter() - start)
+    # Allocations are traced in a separate run, since tracing slows it down
+    state = benchmark.setup()
+    tracemalloc.start()
+    benchmark.run(state)
+    _, alloc_peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    seconds = min(times)
+    return {
+        'name': benchmark.name,
+        'rows': benchmark.rows,
+        'seconds': seconds,
+        'rows_per_sec': benchmark.rows / seconds if seconds > 0 else None,
+        'setup_rss_kb': setup_rss,
+        'peak_rss_kb': _peak_rss_kb(),
+        'alloc_peak_bytes': alloc_peak
+    }
+
+
+def _measure_in_subprocess(name: str, csv_path: str, rows: int, out_dir: str,
+                           memory_rows: int, repeat: int) -> Dict:
+    """
+    Run the benchmark called name in a new Python process and return its results.
+    """
+    command = [sys.executable, __file__, '--child', name, '--csv', csv_path,
+               '--rows', str(rows), '--out-dir', out_dir,
+               '--memory-rows', str(memory_rows), '--repeat', str(repeat)]
+    output = subprocess.run(command, capture_output=True, text=True, check=True).stdout
+    return json.loads(output.splitlines()[-1])
+
+
+def _commit() -> str:
+    try:
+        return subprocess.run(['git', 'rev-parse', 'HEAD'], capture_output=True, text=True,
+                              cwd=Path(__file__).resolve().parent, check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def run_all(rows: int, repeat: int = 3, pattern: str = '*', seed: int = 0,
+            memory_rows: int = DEFAULT_MEMORY_ROWS) -> Dict:
+    """
+    Generate rows synthetic records and run the benchmarks whose names match pattern,
+    each in its own process.
+    Returns:
+        dictionary with keys 'meta' and 'results', ready to be saved as JSON
+    """
+    with tempfile.TemporaryDirectory() as directory:
+        csv_path = generate(os.path.join(directory, 'weather.csv'), rows, seed)
+        results = []
+        for benchmark in benchmarks(csv_path, rows, directory, memory_rows):
+            if fnmatch.fnmatch(benchmark.name, pattern):
+                result = _measure_in_subprocess(benchmark.name, csv_path, rows, directory,
+                                                memory_rows, repeat)
+                results.append(result)
+                print('%-45s %10.4fs %14s rows/s %10s KiB peak RSS' % (
+                    result['name'], result['seconds'],
+                    '%.0f' % result['rows_per_sec'] if result['rows_per_sec'] else '-',
+                    result['peak_rss_kb']))
+    return {
+        'meta': {
+            'commit': _commit(),
+            'timestamp': datetime.datetime.now().isoformat(timespec='seconds'),
+            'python': platform.python_version(),
+            'numpy': np.__version__,
+            'platform': platform.platform(),
+            'rows': rows,
+            'memory_rows': memory_rows,
+            'repeat': repeat,
+            'seed': seed
+        },
+        'results': results
+    }
+
+
+if __name__ == '__main__':
+    parser = argparse.ArgumentParser(description=__doc__)
+    parser.add_argument('--rows', type=int, default=10000,
+                        help='number of synthetic records (10K to 10M)')
+    parser.add_argument('--memory-rows', type=int, default=DEFAULT_MEMORY_ROWS,
+                        help='maximum number of records loaded by in-memory benchmarks')
+    parser.add_argument('--repeat', type=int, default=3, help='timed runs per benchmark')
+    parser.add_argument('--filter', default='*', help='glob selecting benchmark names')
+    parser.add_argument('--seed', type=int, default=0, help='random seed for the data')
+    parser.add_argument('--output', help='JSON file to save the results to')
+    parser.add_argument('--child', help=argparse.SUPPRESS)
+    parser.add_argument('--csv', help=argparse.SUPPRESS)
+    parser.add_argument('--out-dir', help=argparse.SUPPRESS)
+    args = parser.parse_args()
+    if args.child:
+        # Run one benchmark and print its results for run_all
+        selected = [benchmark for benchmark in
+                    benchmarks(args.csv, args.rows, args.out_dir, args.memory_rows)
+                    if benchmark.name == args.child]
+        print(json.dumps(measure(selected[0], args.repeat)))
+        sys.exit(0)
+    report = run_all(args.rows, args.repeat, args.filter, args.seed, args.memory_rows)
+    if args.output:
+        with open(args.output, 'w', encoding='UTF8') as output_file:
+            json.dump(report, output_file, indent=2)
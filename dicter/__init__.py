@@ -0,0 +1,2 @@
+from dicter.compiler import compile
+from dicter.table import Table
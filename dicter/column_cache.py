@@ -0,0 +1,207 @@
+#!/usr/bin/env python
+
+"""Binary columnar caches of csv files for repeated queries."""
+
+import json
+import os
+import shutil
+from typing import Dict, List, Optional
+import numpy as np
+from dicter.mmap_reader import Mmap_reader
+from dicter.table import Table
+
+# Suffix appended to the csv path to name the default cache directory.
+CACHE_SUFFIX = '.dicter'
+
+# Version of the cache layout.  Caches with another version are rebuilt.
+CACHE_VERSION = 3
+
+# Name of the file describing the cache.  It is written last, so a cache
+# without it is incomplete.
+META_FILE = 'meta.json'
+
+
+class Column_cache:
+    """
+    A binary columnar copy of a csv file, stored in a directory.
+
+    Each column is dictionary encoded: the distinct values are stored once
+    and the rows hold int32 codes into them, with -1 for values padded onto
+    short rows.  Columns whose values all parse as floats are also stored as
+    float64 arrays, so numeric conditions and statistics need no parsing.
+    The byte range of each record in the csv file is stored as well, so
+    matching records can be copied from the source unchanged.
+
+    Arrays are stored as .npy files and loaded through memory maps.  The
+    encodings are handed to the Table, so string conditions are evaluated
+    once per distinct value.  The
+    cache records the size and modification time of the csv file and is
+    only used while they are unchanged.
+    """
+
+    def __init__(self, csv_path: str, directory: str = None) -> None:
+        """
+        Create a handle on the cache of a csv file.  Nothing is read or built.
+        Arguments:
+            csv_path  : path to the csv file
+            directory : (optional) cache directory.  Default is csv_path + CACHE_SUFFIX.
+        """
+        self.csv_path = str(csv_path)
+        self.directory = str(directory) if directory is not None \
+            else self.csv_path + CACHE_SUFFIX
+
+    def _path(self, name: str) -> str:
+        return os.path.join(self.directory, name)
+
+    def _source(self) -> Dict:
+        """
+        Return the size and modification time of the csv file.
+        """
+        status = os.stat(self.csv_path)
+        return {'size': status.st_size, 'mtime_ns': status.st_mtime_ns}
+
+    def meta(self) -> Optional[Dict]:
+        """
+        Return the description of the cache, or None if there is no complete cache.
+        """
+        try:
+            with open(self._path(META_FILE), encoding='UTF8') as meta_file:
+                return json.load(meta_file)
+        except (OSError, ValueError):
+            return None
+
+    def is_valid(self) -> bool:
+        """
+        Return true if the cache is complete and the csv file has not changed since
+        it was built.
+        """
+        meta = self.meta()
+        try:
+            return meta is not None and meta.get('version') == CACHE_VERSION \
+                and meta.get('source') == self._source()
+        except OSError:
+            return False
+
+    def build(self) -> 'Column_cache':
+        """
+        Parse the csv file and write the cache, replacing any existing cache.
+        Returns:
+            self
+
+        Rows are read as by csv.DictReader: blank lines are skipped and short
+        rows are padded.  If the header repeats a name, the last column with
+        that name is cached.
+        """
+        source = self._source()
+        if os.path.isdir(self.directory):
+            shutil.rmtree(self.directory)
+        os.makedirs(self.directory)
+        with Mmap_reader(self.csv_path) as reader:
+            field_names = reader.field_names or []
+            header_end = reader.header_end
+            positions = {field: i for i, field in enumerate(field_names)}
+            values = [[] for _ in field_names]
+            spans = []
+            for start, end, row in reader.records():
+                spans.append((start, end))
+                for column, value in zip(values, row):
+                    column.append(value)
+        names = list(positions)
+        numeric = []
+        padded = []
+        for j, name in enumerate(names):
+            column = values[positions[name]]
+            codes, uniques = _encode(column)
+            padded.append(bool(np.any(codes < 0)))
+            np.save(self._path('%d.codes.npy' % j), codes)
+            np.save(self._path('%d.values.npy' % j), np.array(uniques, dtype=str))
+            if padded[-1]:
+                # NumPy would store padded values as NaN, but the scan cannot
+                # convert them, so Table.floats raises and the scan applies on_error
+                numeric.append(False)
+                continue
+            try:
+                floats = np.array(column, dtype=np.float64)
+            except (TypeError, ValueError):
+                numeric.append(False)
+            else:
+                np.save(self._path('%d.floats.npy' % j), floats)
+                numeric.append(True)
+        np.save(self._path('offsets.npy'), np.array(spans, dtype=np.int64).reshape(-1, 2))
+        meta = {
+            'version': CACHE_VERSION,
+            'source': source,
+            'fields': field_names,
+            'header_end': header_end,
+            'columns': names,
+            'numeric': numeric,
+            'padded': padded,
+            'rows': len(spans)
+        }
+        with open(self._path(META_FILE), 'w', encoding='UTF8') as meta_file:
+            json.dump(meta, meta_file)
+        return self
+
+    def table(self) -> Table:
+        """
+        Return the cached columns as a Table.
+        Raises:
+            ValueError if the cache is missing or out of date
+        """
+        if not self.is_valid():
+            raise ValueError("No valid cache for " + self.csv_path)
+        meta = self.meta()
+        columns = {}
+        floats = {}
+        encoded = {}
+        for j, name in enumerate(meta['columns']):
+            codes = np.load(self._path('%d.codes.npy' % j), mmap_mode='r')
+            values = np.load(self._path('%d.values.npy' % j)).tolist()
+            if meta['padded'][j]:
+                # Padded values are None in the Table, with a code of their own
+                codes = np.where(codes < 0, len(values), codes)
+                values.append(None)
+            decoded = np.empty(len(values), dtype=object)
+            decoded[:] = values
+            columns[name] = decoded[codes]
+            encoded[name] = codes, decoded
+            if meta['numeric'][j]:
+                floats[name] = np.load(self._path('%d.floats.npy' % j), mmap_mode='r')
+        return Table(columns, floats=floats, encoded=encoded)
+
+    def offsets(self) -> np.ndarray:
+        """
+        Return an array with one row (start, end) per record, holding the byte
+        range of the record in the csv file.
+        Raises:
+            ValueError if the cache is missing or out of date
+        """
+        if not self.is_valid():
+            raise ValueError("No valid cache for " + self.csv_path)
+        return np.load(self._path('offsets.npy'), mmap_mode='r')
+
+    def field_names(self) -> List[str]:
+        """
+        Return the names in the header of the csv file, or None if there is no cache.
+        """
+        meta = self.meta()
+        return meta['fields'] if meta is not None else None
+
+    def header_end(self) -> int:
+        """
+        Return the offset just past the header record in the csv file.
+        """
+        meta = self.meta()
+        return meta['header_end'] if meta is not None else 0
+
+
+def _encode(column: List) -> tuple:
+    """
+    Dictionary encode a column.
+    Returns:
+        tuple (int32 codes, list of distinct values), with code -1 for None
+    """
+    index = {}
+    codes = np.fromiter((-1 if value is None else index.setdefault(value, len(index))
+                         for value in column), dtype=np.int32, count=len(column))
+    return codes, list(index)
@@ -0,0 +1,354 @@
+#!/usr/bin/env python
+
+"""Compiles Expression trees into flat, specialized predicate functions."""
+
+from functools import lru_cache
+from typing import Callable, Dict, List, Tuple, Union
+from dicter.expression import CONDITIONS, Expression, Match_Type, NUMERIC_TYPES, Term, \
+    shared_keys
+from dicter import optimizer
+from dicter.parser import parse
+
+# Source templates for term conditions.  {x} is replaced by the code that
+# fetches the record value, {n} by the code that yields its float value and
+# {c} by the name of the prepared constant.
+TEMPLATES = {
+    Match_Type.EQUALS: '{x} == {c}',
+    Match_Type.LESS_THAN: '{n} < {c}',
+    Match_Type.GREATER_THAN: '{n} > {c}',
+    Match_Type.LESS_THAN_OR_EQUAL: '{n} <= {c}',
+    Match_Type.GREATER_THAN_OR_EQUAL: '{n} >= {c}',
+    Match_Type.SUBSTRING: '{x} in {c}',
+    Match_Type.STARTS_WITH: '{x}.startswith({c})',
+    Match_Type.ENDS_WITH: '{x}.endswith({c})',
+    Match_Type.FLOAT_EQUALS: '{n} == {c}',
+    Match_Type.REGEX: '{c}.match({x}) is not None',
+    Match_Type.IN: '{x} in {c}'
+}
+
+# Match types whose results compiled predicates remember per distinct record value.
+# The other string conditions are cheaper than a cache lookup.
+MEMOIZED_TYPES = {Match_Type.REGEX}
+
+# Maximum number of distinct values remembered by each memoized term.
+MEMO_SIZE = 4096
+
+# Policies for record values that cannot be converted to float:
+#   raise - the ValueError or TypeError propagates (default)
+#   false - the term comparing the value is false
+#   skip  - the record does not match, whatever the rest of the expression says
+ON_ERROR_POLICIES = ('raise', 'false', 'skip')
+
+# Marks a shared value that has not been computed yet for the current record.
+_UNSET = object()
+
+# Value fetched for a key that the record does not have.
+_MISSING = object()
+
+
+class _Skip(Exception):
+    """
+    Raised by generated code to reject a record under the skip policy.
+    """
+
+
+def _memoized(term: Term) -> Callable[[str], bool]:
+    """
+    Return a function testing term's condition on a value, remembering the
+    results for the MEMO_SIZE most recently tested values.
+    """
+    condition = CONDITIONS[term.type]
+    operand = term.operand
+
+    @lru_cache(maxsize=MEMO_SIZE)
+    def test(value) -> bool:
+        return bool(condition(value, operand))
+    return test
+
+
+def _float_or_nan(value) -> float:
+    """
+    Convert value to float, returning NaN (which compares false) if it is not numeric.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        return float('nan')
+
+
+def _float_or_skip(value) -> float:
+    """
+    Convert value to float, rejecting the record if it is not numeric.
+    """
+    try:
+        return float(value)
+    except (TypeError, ValueError):
+        raise _Skip()
+
+
+_CONVERTERS = {
+    'raise': float,
+    'false': _float_or_nan,
+    'skip': _float_or_skip
+}
+
+
+class _Codegen:
+    """
+    Accumulates the source of a predicate and the constants it refers to.
+
+    A key referenced by several terms is fetched from the record at most
+    once, and a key compared numerically by several terms is converted to
+    float at most once: the first term that needs the value stores it in a
+    local variable that later terms reuse.
+
+    If fields is given, records are sequences holding the value of fields[i]
+    at position i, as produced by csv.reader, rather than dicts.
+    """
+
+    def __init__(self, expressions: List, on_error: str = 'raise',
+                 fields: List[str] = None) -> None:
+        if on_error not in ON_ERROR_POLICIES:
+            raise ValueError("on_error must be one of " + str(ON_ERROR_POLICIES) +
+                             ". Got " + repr(on_error))
+        self.namespace = {'_UNSET': _UNSET, '_MISSING': _MISSING,
+                          '_float': _CONVERTERS[on_error]}
+        self.fields = None
+        if fields is not None:
+            # The last occurrence of a duplicated field name wins, as in csv.DictReader
+            self.fields = {field: i for i, field in enumerate(fields)}
+            self.namespace['_fields'] = list(fields)
+        self.values = {} if fields is not None else \
+            {key: '_v' + str(i) for i, key in enumerate(shared_keys(expressions))}
+        self.floats = {key: '_f' + str(i)
+                       for i, key in enumerate(shared_keys(expressions, NUMERIC_TYPES))}
+
+    def constant(self, value) -> str:
+        """
+        Bind value to a fresh name in the namespace and return the name.
+        """
+        name = '_c' + str(len(self.namespace))
+        self.namespace[name] = value
+        return name
+
+    def prologue(self) -> str:
+        """
+        Return source initializing the shared locals for a record.
+        """
+        names = list(self.values.values()) + list(self.floats.values())
+        return ''.join('    ' + name + ' = _UNSET\n' for name in names)
+
+    def term(self, term: Term) -> str:
+        """
+        Return source for the assertion made by term.
+        """
+        key = self.constant(term.key)
+        if self.fields is not None:
+            if term.key not in self.fields:
+                return 'False'
+            fetch = 'r[' + str(self.fields[term.key]) + ']'
+            present = None
+        elif term.key in self.values:
+            fetch = self.values[term.key]
+            present = _cached(fetch, 'r.get(' + key + ', _MISSING)') + ' is not _MISSING'
+        else:
+            fetch = 'r[' + key + ']'
+            present = key + ' in r'
+        number = '_float(' + fetch + ')'
+        if term.key in self.floats:
+            number = _cached(self.floats[term.key], number)
+        if term.type == Match_Type.RANGE:
+            interval = term.operand
+            test = self.constant(interval.low) + \
+                (' <= ' if interval.low_closed else ' < ') + number + \
+                (' <= ' if interval.high_closed else ' < ') + self.constant(interval.high)
+        elif term.type in MEMOIZED_TYPES:
+            test = self.constant(_memoized(term)) + '(' + fetch + ')'
+        else:
+            test = TEMPLATES[term.type].format(x=fetch, n=number,
+                                               c=self.constant(term.operand))
+        if present is None:
+            return '(' + test + ')'
+        return '(' + present + ' and ' + test + ')'
+
+    def expression(self, expression: Union[Expression, Term]) -> str:
+        """
+        Return source for expression, flattening nested conjunctions and disjunctions.
+        """
+        if isinstance(expression, Term):
+            return self.term(expression)
+        op = getattr(expression, 'op', None)
+        if op in ('$true', '$false'):
+            return str(op == '$true')
+        if op == '$not':
+            return '(not ' + self.expression(expression.operands[0]) + ')'
+        if op in ('$and', '$or'):
+            joiner = ' and ' if op == '$and' else ' or '
+            return '(' + joiner.join(
+                self.expression(operand) for operand in _flatten(expression)) + ')'
+        if isinstance(getattr(expression, 'term', None), Term):
+            return self.term(expression.term)
+        # Opaque expression - fall back to calling its matches function
+        if self.fields is not None:
+            return self.constant(expression.matches) + '(dict(zip(_fields, r)))'
+        return self.constant(expression.matches) + '(r)'
+
+
+def _flatten(expression: Expression) -> List:
+    """
+    Return the operands of expression, splicing in the operands of any
+    operand that applies the same logical operator.
+    """
+    ret = []
+    for operand in expression.operands:
+        if getattr(operand, 'op', None) == expression.op:
+            ret.extend(_flatten(operand))
+        else:
+            ret.append(operand)
+    return ret
+
+
+def _cached(name: str, source: str) -> str:
+    """
+    Return source yielding the local variable name, evaluating source to set it first if unset.
+    """
+    return '(' + name + ' if ' + name + ' is not _UNSET else (' + \
+        name + ' := ' + source + '))'
+
+
+def _build(expressions: List, body: Callable[[List[str]], str], rejected: str,
+           on_error: str, fields: List[str]) -> Callable:
+    """
+    Generate a function of one record from expressions.
+    Arguments:
+        expressions : parsed expressions
+        body        : combines the source of each expression into a return value
+        rejected    : source of the value returned for records rejected by the skip
+                      policy, or None to let _Skip propagate
+        on_error    : policy for record values that cannot be converted to float
+        fields      : field names of sequence records, or None for dict records
+    """
+    codegen = _Codegen(expressions, on_error, fields)
+    result = body([codegen.expression(expression) for expression in expressions])
+    if on_error == 'skip' and rejected is not None:
+        codegen.namespace['_Skip'] = _Skip
+        source = 'def _predicate(r):\n' + codegen.prologue() + \
+            '    try:\n        return ' + result + '\n' + \
+            '    except _Skip:\n        return ' + rejected + '\n'
+    else:
+        source = 'def _predicate(r):\n' + codegen.prologue() + '    return ' + result + '\n'
+    exec(source, codegen.namespace)
+    return codegen.namespace['_predicate']
+
+
+def _subtree(expression: Union[Expression, Term], on_error: str,
+             fields: List[str]) -> Callable:
+    """
+    Return a predicate for expression that lets _Skip propagate, compiling it
+    whole if the Python compiler accepts it and in parts otherwise.
+    """
+    try:
+        return _build([expression], lambda sources: sources[0], None, on_error, fields)
+    except (SyntaxError, RecursionError, MemoryError):
+        return _split(expression, on_error, fields)
+
+
+def _split(expression: Expression, on_error: str, fields: List[str]) -> Callable:
+    """
+    Return a predicate for an expression too deep for the Python compiler,
+    combining predicates compiled separately for its operands.  Records
+    rejected by the skip policy raise _Skip.
+    """
+    op = getattr(expression, 'op', None)
+    if op == '$not':
+        operand = _subtree(expression.operands[0], on_error, fields)
+        return lambda r: not operand(r)
+    if op in ('$and', '$or'):
+        operands = [_subtree(operand, on_error, fields) for operand in _flatten(expression)]
+        combine = all if op == '$and' else any
+        return lambda r: combine(operand(r) for operand in operands)
+    if fields is not None:
+        return lambda row: expression.matches(dict(zip(fields, row)))
+    return expression.matches
+
+
+def _rejecting(predicate: Callable, rejected) -> Callable:
+    """
+    Return predicate, made to return rejected for records rejected by the skip policy.
+    """
+    def wrapper(r):
+        try:
+            return predicate(r)
+        except _Skip:
+            return rejected
+    return wrapper
+
+
+def compile(expression: Union[Expression, Term, Dict],
+            on_error: str = 'raise', optimize: bool = True,
+            fields: List[str] = None) -> Callable[[Dict], bool]:
+    """
+    Compile an expression into a single predicate function.
+    Arguments:
+        expression  : expression to compile, or dict representing an expression
+        on_error    : (optional) policy for record values that cannot be converted
+                      to float - one of ON_ERROR_POLICIES. Default is 'raise'.
+        optimize    : (optional) if true (the default), rewrite the expression with
+                      optimizer.optimize before generating code
+        fields      : (optional) field names.  If given, the compiled function takes
+                      sequence records such as csv.reader rows, holding the value
+                      of fields[i] at position i.  Every row must have a value for
+                      each field.
+    Returns:
+        function taking a record and returning true if the record matches the expression
+
+    Comparison values are taken from the operands prepared by each Term, operators
+    are inlined and nested $and / $or operands are flattened into one
+    short-circuiting boolean expression.  Each key is fetched from the record
+    and converted to float at most once.  If expression is a dict, the dict
+    is parsed first.
+    """
+    if isinstance(expression, dict):
+        expression = parse(expression)
+    if optimize:
+        expression = optimizer.optimize(expression)
+    try:
+        return _build([expression], lambda sources: sources[0], 'False', on_error, fields)
+    except (SyntaxError, RecursionError, MemoryError):
+        return _rejecting(_split(expression, on_error, fields), False)
+
+
+def compile_many(expressions: List[Union[Expression, Term, Dict]],
+                 on_error: str = 'raise', optimize: bool = True,
+                 fields: List[str] = None) -> Callable[[Dict], Tuple[bool, ...]]:
+    """
+    Compile several expressions into one function evaluating all of them.
+    Arguments:
+        expressions : expressions to compile, or dicts representing expressions
+        on_error    : (optional) policy for record values that cannot be converted
+                      to float - one of ON_ERROR_POLICIES. Default is 'raise'.
+        optimize    : (optional) if true (the default), rewrite the expression with
+                      optimizer.optimize before generating code
+        fields      : (optional) field names.  If given, the compiled function takes
+                      sequence records such as csv.reader rows, holding the value
+                      of fields[i] at position i.  Every row must have a value for
+                      each field.
+    Returns:
+        function taking a record and returning a tuple with one boolean per expression
+
+    A key referenced by more than one term, in any of the expressions, is
+    fetched and converted to float at most once per record.  A record
+    rejected by the skip policy matches none of the expressions.
+    """
+    expressions = [parse(expression) if isinstance(expression, dict) else expression
+                   for expression in expressions]
+    if optimize:
+        expressions = [optimizer.optimize(expression) for expression in expressions]
+    try:
+        return _build(expressions,
+                      lambda sources: '(' + ''.join(s + ', ' for s in sources) + ')',
+                      '(' + 'False, ' * len(expressions) + ')', on_error, fields)
+    except (SyntaxError, RecursionError, MemoryError):
+        predicates = [_subtree(expression, on_error, fields) for expression in expressions]
+        return _rejecting(lambda record: tuple(predicate(record) for predicate in predicates),
+                          (False,) * len(expressions))
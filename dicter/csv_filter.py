@@ -1,7 +1,28 @@
 import csv
-from typing import Dict
-from dicter.filter import apply
-from dicter.parser import parse
+import os
+import tempfile
+from array import array
+from contextlib import ExitStack
+from typing import Dict, List, Optional, Tuple, Union
+import numpy as np
+from dicter.column_cache import Column_cache
+from dicter.compiler import compile_many
+from dicter.expression_cache import default_cache
+from dicter.filter import apply, chunks
+from dicter.mmap_reader import Mmap_reader
+from dicter.parallel import filter_parallel
+from dicter.rows import projection, raw_records, rows
+from dicter.stats import Stats, Streaming_stats
+from dicter.table import Table
+
+# Default size in bytes of the output buffer used when streaming.
+DEFAULT_BUFFER_SIZE = 1 << 20
+
+# Default size in bytes of the input ranges handed to parallel workers.
+DEFAULT_RANGE_SIZE = 1 << 26
+
+# Number of lines collected before each writelines call in passthrough mode.
+WRITE_BATCH_LINES = 1 << 12
 
 
 class CSV_filter:
@@ -9,34 +30,94 @@ class CSV_filter:
     Writes filtered extracts of self.in_path to self.out_path.
     """
 
-    def __init__(self, input_file_path: str, output_file_path) -> None:
+    def __init__(self, input_file_path: str, output_file_path,
+                 buffer_size: int = DEFAULT_BUFFER_SIZE, workers: int = 1,
+                 ordered: bool = True, range_size: int = DEFAULT_RANGE_SIZE,
+                 on_error: str = 'raise', passthrough: bool = False,
+                 memory_map: bool = False, use_cache: bool = True,
+                 chunk_size: Optional[int] = None) -> None:
         """
         Create a CSV_filter with the given input and output file paths.
         Arguments:
             input_file_path : full path to the csv input file
             output_file_path : full path to the output file
+            buffer_size : (optional) output buffer size in bytes used when streaming
+            workers : (optional) number of processes used to filter. Default is 1.
+            ordered : (optional) if false, parallel output rows may be reordered
+            range_size : (optional) size in bytes of the input ranges handed to workers
+            on_error : (optional) policy for values that cannot be converted to float.
+                       One of 'raise' (default), 'false' or 'skip'.
+            passthrough : (optional) if true, stream_filtered_file and write_split_files
+                          copy the original text of each matching record to the output
+                          instead of re-serializing its fields
+            memory_map : (optional) if true, stream_filtered_file scans the input as
+                         bytes through a memory map and copies matching records
+                         as in passthrough mode (see mmap_reader.Mmap_reader)
+            use_cache : (optional) if true (the default), stream_filtered_file and
+                        stats query the column_cache.Column_cache of the input
+                        when it is up to date
+            chunk_size : (optional) if given, filters are evaluated with matches_batch on
+                         chunks of this many records (e.g. 8192) when records are read
+                         by csv.reader or csv.DictReader.  Requires on_error='raise'.
+        Raises:
+            ValueError if chunk_size is given and on_error is not 'raise'
         """
+        if chunk_size is not None and on_error != 'raise':
+            raise ValueError("chunk_size requires on_error='raise'. Got " + repr(on_error))
         self.in_path = input_file_path
         self.out_path = output_file_path
+        self.buffer_size = buffer_size
+        self.workers = workers
+        self.ordered = ordered
+        self.range_size = range_size
+        self.on_error = on_error
+        self.passthrough = passthrough
+        self.memory_map = memory_map
+        self.use_cache = use_cache
+        self.chunk_size = chunk_size
 
-    def write_filtered_file(self, dct: Dict):
+    def write_filtered_file(self, dct: Dict) -> int:
         """
         Filter the records in self.in_path using the expression represented by dict.
         Write the filtered records to self.out_path.
         Arguments:
             dct : dictionary representing a filter expression.
+        Returns:
+            number of records written.  If no records match, a message is printed
+            and no file is created.
+
+        If self.workers > 1 the file is filtered in parallel as by stream_filtered_file,
+        into a temporary file that replaces self.out_path if any records match.
         """
+        if self.workers > 1:
+            default_cache.parse(dct)
+            directory = os.path.dirname(os.path.abspath(self.out_path))
+            handle, temp_path = tempfile.mkstemp(suffix='.csv', dir=directory)
+            os.close(handle)
+            try:
+                written = filter_parallel(self.in_path, temp_path, dct, self.workers,
+                                          self.ordered, self.range_size, self.buffer_size,
+                                          self.on_error)[1]
+                if written > 0:
+                    os.replace(temp_path, self.out_path)
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            if written == 0:
+                print("No records to write.  No file created.")
+            return written
+
         # Parse the input dict
-        expression = parse(dct)
+        default_cache.parse(dct)
 
         # Open the input file with explicit encoding
         input_file = csv.DictReader(open(self.in_path, encoding='UTF8'))
 
         # Apply the expression
-        filtered_records = apply(expression, input_file)
+        filtered_records = apply(dct, input_file, self.on_error, self.chunk_size)
         if len(filtered_records) == 0:
             print("No records to write.  No file created.")
-            return
+            return 0
 
         # Get the field names from the first record
         field_names = filtered_records[0].keys()
@@ -46,3 +127,291 @@ class CSV_filter:
             writer = csv.DictWriter(f, fieldnames=field_names)
             writer.writeheader()
             writer.writerows(filtered_records)
+        return len(filtered_records)
+
+    def stream_filtered_file(self, dct: Dict, columns: List[str] = None) -> Tuple[int, int]:
+        """
+        Filter the records in self.in_path using the expression represented by dict,
+        writing each matching record to self.out_path as soon as it is read.
+        Arguments:
+            dct     : dictionary representing a filter expression.
+            columns : (optional) columns to write, in order. Default is all columns.
+        Returns:
+            tuple (rows read, rows written)
+        Raises:
+            ValueError if columns is given and self.passthrough or self.memory_map is true
+
+        Memory use is bounded by self.buffer_size rather than by the size of
+        the output.  The header is taken from the input file, so the output
+        file is created (header only) even if no records match.
+
+        Rows are read as lists and the filter is compiled against the input
+        header, so no dict is built for any row.  If self.chunk_size is set,
+        the filter is instead evaluated on chunks of rows with matches_batch.
+
+        If self.passthrough is true, the header and matching records are copied
+        from the input text unchanged, so their quoting and line endings are
+        preserved.  columns cannot be used in that mode.  If self.memory_map
+        is true, records are also copied unchanged, from a memory map of the
+        input that is scanned without decoding records the filter cannot match.
+
+        If self.use_cache is true and the input has an up to date
+        Column_cache, the filter is evaluated on the cached columns and the
+        input is only read to copy matching records in passthrough mode.
+
+        If self.workers > 1, the input is split into ranges of about
+        self.range_size bytes that are filtered by a pool of processes.
+        """
+        passthrough = self.passthrough or self.memory_map
+        if passthrough and columns is not None:
+            raise ValueError("columns cannot be selected in passthrough mode")
+        if self.workers > 1:
+            return filter_parallel(self.in_path, self.out_path, dct, self.workers,
+                                   self.ordered, self.range_size, self.buffer_size,
+                                   self.on_error, columns, passthrough)
+        default_cache.compile(dct, self.on_error)  # Report parse errors before creating the output
+        if self.use_cache:
+            counts = self._stream_cached(dct, columns, passthrough)
+            if counts is not None:
+                return counts
+        if self.memory_map:
+            with Mmap_reader(self.in_path) as reader, \
+                    open(self.out_path, 'wb', buffering=self.buffer_size) as output_file:
+                output_file.write(reader.header())
+                for view in reader.ranges(dct, self.on_error):
+                    output_file.write(view)
+                    view.release()
+                return reader.rows_read, reader.rows_written
+        if self.passthrough:
+            counts = self._copy_records([dct], [self.out_path])
+            return counts[0], counts[1]
+        rows_read = 0
+        rows_written = 0
+        with open(self.in_path, encoding='UTF8', newline='') as input_file, \
+                open(self.out_path, 'w', encoding='UTF8', newline='',
+                     buffering=self.buffer_size) as output_file:
+            reader = csv.reader(input_file)
+            field_names = next(reader, None)
+            if field_names is None:  # Empty input
+                return rows_read, rows_written
+            header, project = projection(field_names, columns)
+            writer = csv.writer(output_file)
+            writer.writerow(header)
+            if self.chunk_size is not None:
+                expression = default_cache.optimize(dct)
+                fields = {field: i for i, field in enumerate(field_names)}
+                for chunk in chunks(rows(reader, len(field_names)), self.chunk_size):
+                    matched = expression.matches_batch(chunk, fields).nonzero()[0]
+                    writer.writerows(project(chunk[i]) for i in matched.tolist())
+                    rows_read += len(chunk)
+                    rows_written += len(matched)
+                return rows_read, rows_written
+            predicate = default_cache.compile(dct, self.on_error, fields=field_names)
+            write = writer.writerow
+            for row in rows(reader, len(field_names)):
+                rows_read += 1
+                if predicate(row):
+                    write(project(row))
+                    rows_written += 1
+        return rows_read, rows_written
+
+    def write_split_files(self, filters: Dict[str, Dict],
+                          columns: List[str] = None) -> Dict[str, int]:
+        """
+        Filter the records in self.in_path with several expressions in one pass,
+        writing the records that match each expression to its own file.
+        Arguments:
+            filters : dictionary with keys = output file paths and
+                      values = dictionaries representing filter expressions
+            columns : (optional) columns to write, in order. Default is all columns.
+        Returns:
+            dictionary with keys = output file paths and values = rows written
+
+        The input is read and parsed once.  All expressions are evaluated by
+        one compiled function, so a column compared numerically by several
+        filters is converted to float once per record.  Each output file has
+        the input header and is created even if no records match.
+        In passthrough mode the records are copied as by stream_filtered_file.
+        """
+        paths = list(filters)
+        compile_many([filters[path] for path in paths], self.on_error)
+        if self.passthrough:
+            if columns is not None:
+                raise ValueError("columns cannot be selected in passthrough mode")
+            counts = self._copy_records([filters[path] for path in paths], paths)
+            return dict(zip(paths, counts[1:]))
+        rows_written = [0] * len(paths)
+        with ExitStack() as stack:
+            reader = csv.reader(stack.enter_context(
+                open(self.in_path, encoding='UTF8', newline='')))
+            field_names = next(reader, None)
+            writers = []
+            for path in paths:
+                output_file = stack.enter_context(
+                    open(path, 'w', encoding='UTF8', newline='',
+                         buffering=self.buffer_size))
+                writers.append(csv.writer(output_file).writerow)
+            if field_names is not None:
+                predicates = compile_many([filters[path] for path in paths], self.on_error,
+                                          fields=field_names)
+                header, project = projection(field_names, columns)
+                for write in writers:
+                    write(header)
+                targets = list(enumerate(writers))
+                for row in rows(reader, len(field_names)):
+                    for (i, write), matched in zip(targets, predicates(row)):
+                        if matched:
+                            write(project(row))
+                            rows_written[i] += 1
+        return dict(zip(paths, rows_written))
+
+    def _cached_mask(self, dct: Dict) -> Optional[Tuple[Column_cache, Table, np.ndarray]]:
+        """
+        Evaluate dct on the cached columns of the input.
+        Returns:
+            tuple (cache, table, mask of matching rows), or None if the input has no
+            up to date cache or the filter cannot be evaluated on the columns
+        """
+        cache = Column_cache(self.in_path)
+        if not cache.is_valid():
+            return None
+        table = cache.table()
+        try:
+            return cache, table, table.mask(dct)
+        except Exception:
+            # E.g. non-numeric values in a numeric column, or a string condition
+            # on the None of a short row - let the scan apply self.on_error
+            return None
+
+    def _stream_cached(self, dct: Dict, columns: List[str],
+                       passthrough: bool) -> Optional[Tuple[int, int]]:
+        """
+        Write the records satisfying dct using the cache of the input.
+        Returns:
+            tuple (rows read, rows written), or None if the cache cannot be used
+        """
+        cached = self._cached_mask(dct)
+        if cached is None:
+            return None
+        cache, table, mask = cached
+        field_names = cache.field_names()
+        if len(set(field_names)) != len(field_names):
+            return None     # Repeated names - only the last column is cached
+        rows_written = int(np.count_nonzero(mask))
+        if passthrough:
+            spans = cache.offsets()[mask]
+            # Copy runs of adjacent records with one write each
+            breaks = np.flatnonzero(spans[1:, 0] != spans[:-1, 1]) + 1
+            starts = spans[np.concatenate(([0], breaks)), 0] if len(spans) else []
+            ends = spans[np.concatenate((breaks - 1, [-1])), 1] if len(spans) else []
+            with open(self.in_path, 'rb') as input_file, \
+                    open(self.out_path, 'wb', buffering=self.buffer_size) as output_file:
+                output_file.write(input_file.read(cache.header_end()))
+                for start, end in zip(starts, ends):
+                    input_file.seek(start)
+                    output_file.write(input_file.read(end - start))
+        else:
+            header, _ = projection(field_names, columns)
+            with open(self.out_path, 'w', encoding='UTF8', newline='',
+                      buffering=self.buffer_size) as output_file:
+                writer = csv.writer(output_file)
+                writer.writerow(header)
+                writer.writerows(zip(*[table.columns[column][mask] for column in header]))
+        return len(table), rows_written
+
+    def _copy_records(self, dcts: List[Dict], paths: List[str]) -> List[int]:
+        """
+        Copy the header and the text of the records satisfying each of dcts to
+        the corresponding path.
+        Returns:
+            list [rows read, rows written to paths[0], rows written to paths[1], ...]
+        """
+        counts = [0] * (len(paths) + 1)
+        with ExitStack() as stack:
+            records = raw_records(stack.enter_context(
+                open(self.in_path, encoding='UTF8', newline='')))
+            output_files = [stack.enter_context(
+                open(path, 'w', encoding='UTF8', newline='', buffering=self.buffer_size))
+                for path in paths]
+            field_names, header = next(records, (None, []))
+            for output_file in output_files:
+                output_file.writelines(header)
+            if field_names is None:
+                return counts
+            predicates = compile_many(dcts, self.on_error, fields=field_names)
+            batches = [[] for _ in paths]
+            targets = list(zip(batches, output_files, range(1, len(paths) + 1)))
+            for row, lines in records:
+                counts[0] += 1
+                for (batch, output_file, i), matched in zip(targets, predicates(row)):
+                    if matched:
+                        batch.extend(lines)
+                        counts[i] += 1
+                        if len(batch) >= WRITE_BATCH_LINES:
+                            output_file.writelines(batch)
+                            batch.clear()
+            for batch, output_file, _ in targets:
+                output_file.writelines(batch)
+        return counts
+
+    def stats(self, dct: Dict, columns: List[str],
+              streaming: bool = False) -> Dict[str, Union[Stats, Streaming_stats]]:
+        """
+        Compute statistics on columns of the records in self.in_path that
+        satisfy the expression represented by dict, in a single scan.
+        Arguments:
+            dct       : dictionary representing a filter expression
+            columns   : columns to compute statistics for
+            streaming : (optional) if true, accumulate Streaming_stats in constant
+                        memory instead of buffering the values for exact Stats
+        Returns:
+            dictionary with keys = columns and values = Stats or Streaming_stats
+
+        Only the requested columns of matching rows are converted to float;
+        no list of records and no output file is created.  If self.use_cache
+        is true and the input has an up to date Column_cache, the cached float
+        columns are used and the input is not read.
+        """
+        default_cache.compile(dct, self.on_error)
+        if self.use_cache:
+            cached = self._cached_mask(dct)
+            if cached is not None:
+                try:
+                    return self._cached_stats(cached[1], cached[2], columns, streaming)
+                except Exception:
+                    pass    # Let the scan report values the columns cannot handle
+        if streaming:
+            accumulators = {column: Streaming_stats(column) for column in columns}
+            adders = [accumulators[column].add for column in columns]
+        else:
+            buffers = {column: array('d') for column in columns}
+            adders = [buffers[column].append for column in columns]
+        with open(self.in_path, encoding='UTF8', newline='') as input_file:
+            reader = csv.reader(input_file)
+            field_names = next(reader, [])
+            positions = {field: i for i, field in enumerate(field_names)}
+            targets = [(positions[column], add) for column, add in zip(columns, adders)]
+            predicate = default_cache.compile(dct, self.on_error, fields=field_names)
+            for row in rows(reader, len(field_names)):
+                if predicate(row):
+                    for i, add in targets:
+                        add(float(row[i]))
+        if streaming:
+            return accumulators
+        return {column: Stats.from_values(buffers[column], column) for column in columns}
+
+    @staticmethod
+    def _cached_stats(table: Table, mask: np.ndarray, columns: List[str],
+                      streaming: bool) -> Dict[str, Union[Stats, Streaming_stats]]:
+        """
+        Compute statistics on columns of the rows of table selected by mask.
+        """
+        values = {column: table.floats(column)[mask] for column in columns}
+        if not streaming:
+            return {column: Stats.from_values(values[column], column) for column in columns}
+        ret = {}
+        for column in columns:
+            ret[column] = Streaming_stats(column)
+            for value in values[column].tolist():
+                ret[column].add(value)
+        return ret
@@ -2,9 +2,13 @@
 
 """Implements filters expressed using boolean combinations of attributes."""
 
-from typing import Dict, List, Union
+from collections import Counter
+from typing import Collection, Dict, Iterator, List, Optional, Union
 from enum import Enum
+from operator import itemgetter
+from time import perf_counter
 import re
+import numpy as np
 
 
 class Match_Type(Enum):
@@ -22,24 +26,191 @@ class Match_Type(Enum):
     FLOAT_EQUALS = 9            # Float values equal
     REGEX = 10                  # Satisfies regex
     IN = 11                     # In
+    RANGE = 12                  # Float value in an Interval
 
 
+# Match types that compare float values.
+NUMERIC_TYPES = {
+    Match_Type.LESS_THAN,
+    Match_Type.GREATER_THAN,
+    Match_Type.LESS_THAN_OR_EQUAL,
+    Match_Type.GREATER_THAN_OR_EQUAL,
+    Match_Type.FLOAT_EQUALS,
+    Match_Type.RANGE
+}
+
 # Dictionary with keys = condition names and values = condition implementations.
+# The second argument is the operand prepared by prepare() when the Term was created.
 CONDITIONS = {
     Match_Type.EQUALS: lambda x, y: x == y,
-    Match_Type.LESS_THAN: lambda x, y: float(x) < float(y),
-    Match_Type.GREATER_THAN: lambda x, y: float(x) > float(y),
-    Match_Type.LESS_THAN_OR_EQUAL: lambda x, y: float(x) <= float(y),
-    Match_Type.GREATER_THAN_OR_EQUAL: lambda x, y: float(x) >= float(y),
+    Match_Type.LESS_THAN: lambda x, y: float(x) < y,
+    Match_Type.GREATER_THAN: lambda x, y: float(x) > y,
+    Match_Type.LESS_THAN_OR_EQUAL: lambda x, y: float(x) <= y,
+    Match_Type.GREATER_THAN_OR_EQUAL: lambda x, y: float(x) >= y,
     Match_Type.SUBSTRING: lambda x, y: x in y,
     Match_Type.STARTS_WITH: lambda x, y: x.startswith(y),
     Match_Type.ENDS_WITH: lambda x, y: x.endswith(y),
-    Match_Type.FLOAT_EQUALS: lambda x, y: float(x) == float(y),
-    Match_Type.REGEX: lambda x, y: re.compile(y).match(x),
-    Match_Type.IN: lambda x, y: x in y
+    Match_Type.FLOAT_EQUALS: lambda x, y: float(x) == y,
+    Match_Type.REGEX: lambda x, y: y.match(x),
+    Match_Type.IN: lambda x, y: x in y,
+    Match_Type.RANGE: lambda x, y: float(x) in y
+}
+
+# NumPy comparisons implementing the numeric conditions on float arrays.
+NUMERIC_UFUNCS = {
+    Match_Type.LESS_THAN: np.less,
+    Match_Type.GREATER_THAN: np.greater,
+    Match_Type.LESS_THAN_OR_EQUAL: np.less_equal,
+    Match_Type.GREATER_THAN_OR_EQUAL: np.greater_equal,
+    Match_Type.FLOAT_EQUALS: np.equal
+}
+
+# Dictionary with keys = match types and values = their symbols in the dict syntax.
+SYMBOLS = {
+    Match_Type.EQUALS: '$eq',
+    Match_Type.LESS_THAN: '$lt',
+    Match_Type.GREATER_THAN: '$gt',
+    Match_Type.LESS_THAN_OR_EQUAL: '$le',
+    Match_Type.GREATER_THAN_OR_EQUAL: '$ge',
+    Match_Type.SUBSTRING: '$substr',
+    Match_Type.STARTS_WITH: '$startswith',
+    Match_Type.ENDS_WITH: '$endswith',
+    Match_Type.FLOAT_EQUALS: '$feq',
+    Match_Type.REGEX: '$re',
+    Match_Type.IN: '$in',
+    Match_Type.RANGE: '$range'
 }
 
 
+class Interval:
+    """
+    A set of floats between low and high, used as the operand of RANGE Terms.
+    Each end is excluded unless the corresponding closed flag is set.  A closed
+    flag left as None closes an infinite end and opens a finite one, so an
+    unbounded end admits -inf or inf.
+    """
+
+    __slots__ = ('low', 'high', 'low_closed', 'high_closed')
+
+    def __init__(self, low: float = float('-inf'), high: float = float('inf'),
+                 low_closed: bool = None, high_closed: bool = None) -> None:
+        self.low = float(low)
+        self.high = float(high)
+        self.low_closed = self.low == float('-inf') if low_closed is None else low_closed
+        self.high_closed = self.high == float('inf') if high_closed is None else high_closed
+
+    def __contains__(self, x: float) -> bool:
+        if x < self.low or x > self.high:
+            return False
+        if x == self.low and not self.low_closed:
+            return False
+        if x == self.high and not self.high_closed:
+            return False
+        return x == x  # NaN is in no interval
+
+    def __eq__(self, other) -> bool:
+        return isinstance(other, Interval) and self.as_tuple() == other.as_tuple()
+
+    def __hash__(self) -> int:
+        return hash(self.as_tuple())
+
+    def __repr__(self) -> str:
+        return 'Interval' + repr(self.as_tuple())
+
+    def __reduce__(self):
+        return Interval, self.as_tuple()
+
+    def as_tuple(self) -> tuple:
+        return (self.low, self.high, self.low_closed, self.high_closed)
+
+    def is_empty(self) -> bool:
+        """
+        Return true if no float is in this interval.
+        """
+        if self.low == self.high:
+            return not (self.low_closed and self.high_closed)
+        return not self.low < self.high
+
+    def intersect(self, other: 'Interval') -> 'Interval':
+        """
+        Return the interval of floats in both this interval and other.
+        """
+        if self.low > other.low:
+            low, low_closed = self.low, self.low_closed
+        elif self.low < other.low:
+            low, low_closed = other.low, other.low_closed
+        else:
+            low, low_closed = self.low, self.low_closed and other.low_closed
+        if self.high < other.high:
+            high, high_closed = self.high, self.high_closed
+        elif self.high > other.high:
+            high, high_closed = other.high, other.high_closed
+        else:
+            high, high_closed = self.high, self.high_closed and other.high_closed
+        return Interval(low, high, low_closed, high_closed)
+
+
+class Parse_error(Exception):
+    """
+    Exception raised when an error occurs parsing an input dictionary.
+    """
+
+    def __init__(self, msg: str = "") -> None:
+        """
+        Create a ParseError with the given error string.
+        Arguments:
+            msg : message string. Defaults to empty string.
+        """
+        super().__init__()
+        self.message = msg
+
+
+def prepare(value: Union[str, List], tp: Match_Type):
+    """
+    Convert a comparison value into the operand used by CONDITIONS[tp].
+    Arguments:
+        value : comparison value or containing list
+        tp    : the type of comparison
+    Returns:
+        float for numeric comparisons, Interval for ranges, compiled pattern
+        for regex matches, frozenset for list inclusion and value unchanged otherwise
+    Raises:
+        Parse_error if value is not a valid operand for tp
+    """
+    if tp == Match_Type.RANGE:
+        if isinstance(value, Interval):
+            return value
+        try:
+            # None (JSON null) marks an open end
+            value = list(value)
+            if len(value) > 0 and value[0] is None:
+                value[0] = float('-inf')
+            if len(value) > 1 and value[1] is None:
+                value[1] = float('inf')
+            return Interval(*value)
+        except (TypeError, ValueError):
+            raise Parse_error("Expecting (low, high[, low_closed, high_closed]) for " +
+                              tp.name + ". Got " + repr(value))
+    if tp in NUMERIC_TYPES:
+        try:
+            return float(value)
+        except (TypeError, ValueError):
+            raise Parse_error("Expecting a numeric value for " +
+                              tp.name + ". Got " + repr(value))
+    if tp == Match_Type.REGEX:
+        try:
+            return re.compile(value)
+        except (TypeError, re.error) as err:
+            raise Parse_error("Invalid regular expression " +
+                              repr(value) + ": " + str(err))
+    if tp == Match_Type.IN and isinstance(value, (list, tuple, set, frozenset)):
+        try:
+            return frozenset(value)
+        except TypeError:  # unhashable members - fall back to a linear scan
+            return tuple(value)
+    return value
+
+
 class Term:
     """
     Terms represent atomic assertions of the form
@@ -55,8 +226,13 @@ class Term:
 
     Terms are the building blocks for Expressions which are
     boolean combinations of terms.
+
+    Terms pickle as their key, value and type, and are prepared again when
+    they are unpickled.
     """
 
+    __slots__ = ('key', 'value', 'type', 'operand')
+
     def __init__(self, key: str, value: Union[str, List],
                  tp: Match_Type = Match_Type.EQUALS) -> None:
         """
@@ -65,62 +241,296 @@ class Term:
             key:    the key whose value will be examined
             value:  comparison value or containing list
             tp:   (optional) the type of comparison. Default is equals.
+        Raises:
+            Parse_error if value is not a valid operand for tp
         """
         self.key = key
         self.value = value
         self.type = tp
+        self.operand = prepare(value, tp)
 
     def matches(self, record: Dict) -> bool:
         """
         Return true if the record matches the assertion made by this Term.
         """
         if self.key in record:
-            return CONDITIONS[self.type](record[self.key], self.value)
+            return CONDITIONS[self.type](record[self.key], self.operand)
         else:
             return False
 
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """
+        Return a boolean array marking the records that match this Term.
+        Arguments:
+            records : records to examine
+            fields  : (optional) positions of the keys, if records are lists
+                      rather than dicts.  Keys that are not in fields match nothing.
+
+        The values of the key are pulled from all records at once.  Numeric
+        conditions compare them as a float array; other conditions are
+        tested once per distinct value.
+        """
+        count = len(records)
+        if fields is not None:
+            if self.key not in fields:
+                return np.zeros(count, dtype=bool)
+            position = fields[self.key]
+            values = list(map(itemgetter(position), records))
+            present = None
+        else:
+            key = self.key
+            present = None
+            try:
+                values = list(map(itemgetter(key), records))
+            except KeyError:
+                values = [record[key] for record in records if key in record]
+                present = np.fromiter((key in record for record in records),
+                                      dtype=bool, count=count)
+        if self.type in NUMERIC_UFUNCS or self.type == Match_Type.RANGE:
+            numbers = np.fromiter(map(float, values), dtype=float, count=len(values))
+            if self.type == Match_Type.RANGE:
+                interval = self.operand
+                low = np.greater_equal if interval.low_closed else np.greater
+                high = np.less_equal if interval.high_closed else np.less
+                matched = low(numbers, interval.low) & high(numbers, interval.high)
+            else:
+                matched = NUMERIC_UFUNCS[self.type](numbers, self.operand)
+        elif self.type == Match_Type.EQUALS and isinstance(self.operand, (str, int, float)):
+            column = np.empty(len(values), dtype=object)
+            column[:] = values
+            matched = np.asarray(column == self.operand, dtype=bool)
+        else:
+            condition = CONDITIONS[self.type]
+            operand = self.operand
+            try:
+                lookup = {value: bool(condition(value, operand)) for value in set(values)}
+                test = lookup.__getitem__
+            except TypeError:   # unhashable values
+                def test(value) -> bool:
+                    return bool(condition(value, operand))
+            matched = np.fromiter(map(test, values), dtype=bool, count=len(values))
+        if present is None:
+            return matched
+        ret = np.zeros(count, dtype=bool)
+        ret[present] = matched
+        return ret
+
+    def __reduce__(self):
+        return Term, (self.key, self.value, self.type)
+
+    def to_dict(self) -> Dict:
+        """
+        Return the dict syntax for this Term, e.g. {'$lt': {'age': 20}}.
+        """
+        if self.type == Match_Type.RANGE:
+            # Open ends are written as None, so that they can be written as JSON
+            value = list(self.operand.as_tuple())
+            value[0] = None if value[0] == float('-inf') else value[0]
+            value[1] = None if value[1] == float('inf') else value[1]
+        elif self.type == Match_Type.REGEX and not isinstance(self.value, str):
+            value = self.operand.pattern
+        elif self.type == Match_Type.IN and isinstance(self.value, tuple):
+            value = list(self.value)
+        elif self.type == Match_Type.IN and isinstance(self.value, (set, frozenset)):
+            value = sorted(self.value, key=repr)
+        else:
+            value = self.value
+        return {SYMBOLS[self.type]: {self.key: value}}
+
 
 class Expression:
     """
     An Expression is a logical combination of terms.
+
+    Atomic expressions hold a Term.  Composite expressions are the And, Or,
+    Not and Const subclasses created by conj, disj, neg and const.  Each
+    records its logical operator in op and its subexpressions in operands
+    so that the tree can be inspected and compiled.  The node classes
+    hold no functions, so expressions can be pickled, e.g. to send them
+    to worker processes, and converted back to dicts with to_dict.
     """
 
+    __slots__ = ('term', 'op', 'operands', 'matches')
+
     def __init__(self, term: Term) -> None:
         """
         Create an atomic expression from a Term.
+
+        An expression created without a term is opaque: assign its matches
+        function and compilers evaluate it by calling matches.
         """
+        self.term = term
+        self.op = None
+        self.operands = []
         if term is not None:
             self.matches = term.matches
 
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        """
+        Return a boolean array marking the records that match this expression.
+        Arguments:
+            records : records to examine
+            fields  : (optional) positions of the keys, if records are lists
+                      rather than dicts
+
+        Opaque expressions are evaluated by calling matches on each record,
+        converted to a dict if fields is given.
+        """
+        if self.term is not None:
+            return self.term.matches_batch(records, fields)
+        matches = self.matches
+        if fields is not None:
+            positions = list(fields.items())
+            return np.fromiter((bool(matches({key: record[i] for key, i in positions}))
+                                for record in records), dtype=bool, count=len(records))
+        return np.fromiter((bool(matches(record)) for record in records),
+                           dtype=bool, count=len(records))
+
+    def __reduce__(self):
+        if self.term is None:
+            raise TypeError('cannot pickle an opaque %s' % type(self).__name__)
+        return Expression, (self.term,)
+
+    def to_dict(self) -> Dict:
+        """
+        Return the dict syntax for this expression, as accepted by parser.parse.
+        Raises:
+            TypeError if the expression is opaque
+        """
+        if self.term is None:
+            raise TypeError('cannot convert an opaque %s to a dict' % type(self).__name__)
+        return self.term.to_dict()
 
-def __satisfies_any(record: Dict, expressions: List[Expression]):
+
+class And(Expression):
     """
-    Return true if record satisfies any of the Expressions in expressions.
-    Arguments:
-        record      : record to examine
-        expressions : expressions to evaluate to find a match
-    Returns:
-        true if matches returns true for any expression in expressions when applied to record 
+    The logical conjunction of operands.
+    """
+
+    __slots__ = ()
+
+    def __init__(self, operands: List[Expression]) -> None:
+        super().__init__(None)
+        self.op = '$and'
+        self.operands = operands
+
+    def __reduce__(self):
+        return And, (self.operands,)
+
+    def matches(self, record: Dict) -> bool:
+        for operand in self.operands:
+            if not operand.matches(record):
+                return False
+        return True
+
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        # Each operand is evaluated only on the records that every earlier operand matched
+        count = len(records)
+        alive = np.arange(count)
+        for operand in self.operands:
+            if len(alive) == 0:
+                break
+            subset = records
+            if len(alive) < count:
+                subset = list(map(records.__getitem__, alive.tolist()))
+            alive = alive[operand.matches_batch(subset, fields)]
+        ret = np.zeros(count, dtype=bool)
+        ret[alive] = True
+        return ret
+
+    def to_dict(self) -> Dict:
+        return {self.op: [operand.to_dict() for operand in self.operands]}
+
+
+class Or(Expression):
+    """
+    The logical disjunction of operands.
     """
-    for exp in expressions:
-        if exp.matches(record):
-            return True
-    return False
 
+    __slots__ = ()
+
+    def __init__(self, operands: List[Expression]) -> None:
+        super().__init__(None)
+        self.op = '$or'
+        self.operands = operands
+
+    def __reduce__(self):
+        return Or, (self.operands,)
+
+    def matches(self, record: Dict) -> bool:
+        for operand in self.operands:
+            if operand.matches(record):
+                return True
+        return False
+
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        # Each operand is evaluated only on the records that no earlier operand matched
+        count = len(records)
+        ret = np.zeros(count, dtype=bool)
+        rest = np.arange(count)
+        for operand in self.operands:
+            if len(rest) == 0:
+                break
+            subset = records
+            if len(rest) < count:
+                subset = list(map(records.__getitem__, rest.tolist()))
+            matched = operand.matches_batch(subset, fields)
+            ret[rest[matched]] = True
+            rest = rest[~matched]
+        return ret
 
-def __satisfies_all(record: Dict, expressions: List[Expression]):
+    def to_dict(self) -> Dict:
+        return {self.op: [operand.to_dict() for operand in self.operands]}
+
+
+class Not(Expression):
     """
-    Return true if record satisfies all of the Expressions in expressions.
-    Arguments:
-        record      : record to examine
-        expressions : expressions to evaluate
-    Returns:
-        true if matches returns true for each expression in expressions when applied to record
+    The logical negation of an expression.
     """
-    for exp in expressions:
-        if not exp.matches(record):
-            return False
-    return True
+
+    __slots__ = ()
+
+    def __init__(self, expression: Expression) -> None:
+        super().__init__(None)
+        self.op = '$not'
+        self.operands = [expression]
+
+    def __reduce__(self):
+        return Not, (self.operands[0],)
+
+    def matches(self, record: Dict) -> bool:
+        return not self.operands[0].matches(record)
+
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        return ~self.operands[0].matches_batch(records, fields)
+
+    def to_dict(self) -> Dict:
+        return {self.op: self.operands[0].to_dict()}
+
+
+class Const(Expression):
+    """
+    An expression that is always true or always false.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value: bool) -> None:
+        super().__init__(None)
+        self.value = bool(value)
+        self.op = '$true' if value else '$false'
+
+    def __reduce__(self):
+        return Const, (self.value,)
+
+    def matches(self, record: Dict) -> bool:
+        return self.value
+
+    def matches_batch(self, records: List, fields: Optional[Dict[str, int]] = None) -> np.ndarray:
+        return np.full(len(records), self.value)
+
+    def to_dict(self) -> Dict:
+        return {self.op: []}
 
 
 def disj(disjuncts: List[Expression]) -> Expression:
@@ -131,9 +541,7 @@ def disj(disjuncts: List[Expression]) -> Expression:
     Returns:
         expression equivalent to disjunction of disjuncts
     """
-    ret = Expression(None)
-    ret.matches = lambda record: __satisfies_any(record, disjuncts)
-    return ret
+    return Or(disjuncts)
 
 
 def conj(conjuncts: List[Expression]) -> Expression:
@@ -144,9 +552,7 @@ def conj(conjuncts: List[Expression]) -> Expression:
     Returns:
         expression equivalent to conjunction of conjuncts
     """
-    ret = Expression(None)
-    ret.matches = lambda record: __satisfies_all(record, conjuncts)
-    return ret
+    return And(conjuncts)
 
 
 def neg(expression: Expression) -> Expression:
@@ -157,6 +563,199 @@ def neg(expression: Expression) -> Expression:
     Returns:
         negated expression
     """
-    ret = Expression(None)
-    ret.matches = lambda record: not expression.matches(record)
-    return ret
+    return Not(expression)
+
+
+def const(value: bool) -> Expression:
+    """
+    Create an expression that is always true or always false.
+    Arguments:
+        value : the truth value of the expression
+    Returns:
+        constant expression
+    """
+    return Const(value)
+
+
+def terms(expression: Union[Expression, Term]) -> Iterator[Term]:
+    """
+    Iterate over the Terms in expression.  Opaque expressions contribute no Terms.
+    """
+    if isinstance(expression, Term):
+        yield expression
+    elif isinstance(getattr(expression, 'term', None), Term):
+        yield expression.term
+    else:
+        for operand in getattr(expression, 'operands', []):
+            yield from terms(operand)
+
+
+def shared_keys(expressions: List[Union[Expression, Term]],
+                types: Optional[Collection[Match_Type]] = None) -> List:
+    """
+    Return the keys referenced by more than one Term in expressions.
+    Arguments:
+        expressions : expressions to examine
+        types       : (optional) only count Terms with these match types
+    Returns:
+        list of keys, in order of first reference
+    """
+    counts = Counter(term.key for expression in expressions for term in terms(expression)
+                     if types is None or term.type in types)
+    return [key for key, count in counts.items() if count > 1]
+
+
+class Adaptive_expression(Expression):
+    """
+    A conjunction or disjunction that reorders its operands using statistics
+    gathered while it is evaluated.
+
+    For the first sample_size records, every operand is evaluated and its
+    pass rate and evaluation time are recorded.  The operands are then
+    ordered so that the ones most likely to decide the result cheaply run
+    first: conjuncts by increasing time / (1 - pass rate), disjuncts by
+    increasing time / pass rate.  An operand that raised an exception while
+    sampling stays behind the operands written before it, which may guard
+    it.  After recheck_interval more records the statistics are gathered
+    again, so the order follows drifting data.
+
+    Operands are compiled into predicates with compiler.compile, and the
+    reordered operands are compiled again into a single predicate.
+    Adaptive expressions have no op, so compilers and Tables evaluate them
+    through matches.
+    """
+
+    def __init__(self, operands: List[Expression], conjunctive: bool,
+                 sample_size: int = 1000, recheck_interval: int = 100000,
+                 on_error: str = 'raise') -> None:
+        """
+        Create an adaptive expression.
+        Arguments:
+            operands         : expressions to combine
+            conjunctive      : true to combine using AND, false to combine using OR
+            sample_size      : (optional) number of records used to gather statistics
+            recheck_interval : (optional) number of records between samples
+            on_error         : (optional) policy for values that cannot be converted
+                               to float - one of compiler.ON_ERROR_POLICIES
+        """
+        # Imported here because the compiler imports this module
+        from dicter.compiler import compile
+        super().__init__(None)
+        self.operands = operands
+        self.conjunctive = conjunctive
+        self.sample_size = sample_size
+        self.recheck_interval = recheck_interval
+        self.on_error = on_error
+        self._order = list(range(len(operands)))
+        self.order = list(operands)
+        self._compile = lambda expression: compile(expression, on_error, False)
+        self._predicates = [self._compile(operand) for operand in operands]
+        self._predicate = None
+        self._start_sample()
+
+    def _start_sample(self) -> None:
+        self._count = 0
+        self._passes = [0] * len(self.operands)
+        self._times = [0.0] * len(self.operands)
+        self._raised = [False] * len(self.operands)
+        self._evaluate = self._sample
+        self._remaining = self.sample_size
+
+    def _reorder(self) -> None:
+        """
+        Order the operands using the gathered statistics and compile them in that order.
+        """
+        def rank(i: int) -> float:
+            rate = self._passes[i] / self._count
+            decisive = 1 - rate if self.conjunctive else rate
+            return self._times[i] / decisive if decisive > 0 else float('inf')
+        count = len(self.operands)
+        order = sorted((i for i in range(count) if not self._raised[i]), key=rank)
+        for i in range(count):
+            if self._raised[i]:
+                # Keep it behind every operand written before it
+                order.insert(max((order.index(j) for j in range(i)), default=-1) + 1, i)
+        self._order = order
+        self.order = [self.operands[i] for i in order]
+        self._predicate = self._compile(conj(self.order) if self.conjunctive
+                                        else disj(self.order))
+
+    def _sample(self, record: Dict) -> bool:
+        """
+        Evaluate every operand against record, recording pass rates and times,
+        and return the result the current order gives.
+        """
+        self._count += 1
+        results = []
+        for i, predicate in enumerate(self._predicates):
+            start = perf_counter()
+            try:
+                result = bool(predicate(record))
+            except Exception as err:
+                result = err
+                self._raised[i] = True
+            self._times[i] += perf_counter() - start
+            if result is True:
+                self._passes[i] += 1
+            results.append(result)
+        # Stop at the first operand that decides the result, as _predicate would
+        for i in self._order:
+            if isinstance(results[i], Exception):
+                raise results[i]
+            if results[i] != self.conjunctive:
+                return not self.conjunctive
+        return self.conjunctive
+
+    def matches(self, record: Dict) -> bool:
+        self._remaining -= 1
+        if self._remaining > 0:
+            return self._evaluate(record)
+        # The last record of a sample or of the interval between samples
+        try:
+            return self._evaluate(record)
+        finally:
+            if self._evaluate == self._sample:
+                self._reorder()
+                self._evaluate = self._predicate
+                self._remaining = self.recheck_interval
+            else:
+                self._start_sample()
+
+
+def adaptive(expression: Union[Expression, Term], sample_size: int = 1000,
+             recheck_interval: int = 100000, on_error: str = 'raise') -> Expression:
+    """
+    Create an expression equivalent to expression whose conjunctions and
+    disjunctions reorder their operands based on runtime statistics.
+    Arguments:
+        expression       : expression to convert
+        sample_size      : (optional) number of records used to gather statistics
+        recheck_interval : (optional) number of records between samples
+        on_error         : (optional) policy for values that cannot be converted
+                           to float - one of compiler.ON_ERROR_POLICIES
+    Returns:
+        expression built from Adaptive_expressions
+
+    The expression is first rewritten by optimizer.optimize, which flattens
+    nested conjunctions and disjunctions and merges terms on the same key.
+    The statistics are updated as matches is called, so the returned
+    expression should not be shared between threads.
+    """
+    # Imported here because the optimizer imports this module
+    from dicter.optimizer import optimize
+    return _adaptive(optimize(expression), sample_size, recheck_interval, on_error)
+
+
+def _adaptive(expression: Expression, sample_size: int, recheck_interval: int,
+              on_error: str) -> Expression:
+    if isinstance(expression, Term):
+        return Expression(expression)
+    op = getattr(expression, 'op', None)
+    if op == '$not':
+        return neg(_adaptive(expression.operands[0], sample_size, recheck_interval, on_error))
+    if op in ('$and', '$or'):
+        operands = [_adaptive(operand, sample_size, recheck_interval, on_error)
+                    for operand in expression.operands]
+        return Adaptive_expression(operands, op == '$and', sample_size, recheck_interval,
+                                   on_error)
+    return expression
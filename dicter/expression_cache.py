@@ -0,0 +1,183 @@
+#!/usr/bin/env python
+
+"""LRU caches of parsed and compiled filter dicts."""
+
+from collections import OrderedDict
+from threading import Lock
+from typing import Callable, Dict, Hashable, List, Union
+from dicter import compiler
+from dicter import optimizer
+from dicter.expression import Expression, Term
+from dicter.parser import CONST_SYMBOLS, LOGIC_SYMBOLS, MATCH_SYMBOLS, parse as parse_dict
+
+# Default maximum number of entries in an Expression_cache.
+DEFAULT_CACHE_SIZE = 1024
+
+
+def _freeze(value) -> Hashable:
+    """
+    Return a hashable form of an operand, tagged with its type.
+    """
+    if isinstance(value, dict):
+        return ('dict', tuple(sorted(((key, _freeze(item)) for key, item in value.items()),
+                                     key=repr)))
+    if isinstance(value, (list, tuple)):
+        return (type(value).__name__, tuple(_freeze(item) for item in value))
+    if isinstance(value, (set, frozenset)):
+        return ('set', frozenset(_freeze(item) for item in value))
+    return (type(value).__name__, value)
+
+
+def canonical(dct: Dict) -> Hashable:
+    """
+    Return a hashable key identifying the expression represented by dct.
+    Arguments:
+        dct : dictionary representing a filter expression
+    Returns:
+        a value that is equal for dicts that differ only in whether $eq is written out
+    Raises:
+        Parse_error if dct is not valid
+
+    The order of $and / $or operands is part of the key: it decides which
+    operands guard the others, so an expression written in another order
+    may raise a conversion error on a record that this one rejects.
+    """
+    if not isinstance(dct, dict) or len(dct) != 1:
+        parse_dict(dct)     # Raises the parse error
+    key = next(iter(dct))
+    if key in CONST_SYMBOLS:
+        return (key,)
+    if key in LOGIC_SYMBOLS:
+        if key == '$not':
+            return ('$not', canonical(dct[key]))
+        args = dct[key]
+        if not isinstance(args, list) or len(args) < 2:
+            parse_dict(dct)
+        return (key, tuple(canonical(arg) for arg in args))
+    if key in MATCH_SYMBOLS:
+        entry = dct[key]
+        symbol = key
+    else:
+        entry = dct
+        symbol = '$eq'
+    attr = next(iter(entry))
+    return (symbol, attr, _freeze(entry[attr]))
+
+
+class Expression_cache:
+    """
+    A thread-safe LRU cache of the expressions and predicates built from filter dicts.
+
+    Entries are keyed by canonical(dct), so the same filter written with or
+    without $eq is parsed once.  Parsed, optimized and compiled forms are cached separately.
+    hits and misses count lookups since the cache was created or cleared.
+    """
+
+    def __init__(self, maxsize: int = DEFAULT_CACHE_SIZE) -> None:
+        """
+        Create an empty cache.
+        Arguments:
+            maxsize : (optional) maximum number of entries.  0 disables caching.
+        """
+        self.maxsize = maxsize
+        self.hits = 0
+        self.misses = 0
+        self._entries = OrderedDict()
+        self._lock = Lock()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def _get(self, key: Hashable, build: Callable[[], object]):
+        """
+        Return the entry for key, building and storing it if it is not cached.
+        """
+        with self._lock:
+            if key in self._entries:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return self._entries[key]
+            self.misses += 1
+        # Build outside the lock; concurrent misses on one key build twice
+        value = build()
+        with self._lock:
+            if self.maxsize > 0:
+                self._entries[key] = value
+                self._entries.move_to_end(key)
+                while len(self._entries) > self.maxsize:
+                    self._entries.popitem(last=False)
+        return value
+
+    def _key(self, *parts) -> Hashable:
+        """
+        Return parts as a cache key, or None if some part cannot be hashed.
+        """
+        try:
+            hash(parts)
+        except TypeError:
+            return None
+        return parts
+
+    def parse(self, dct: Dict) -> Expression:
+        """
+        Return parser.parse(dct), reusing the expression parsed for an equivalent dict.
+        """
+        key = self._key('parse', canonical(dct))
+        if key is None:
+            return parse_dict(dct)
+        return self._get(key, lambda: parse_dict(dct))
+
+    def optimize(self, dct: Dict) -> Expression:
+        """
+        Return optimizer.optimize(dct), reusing the result for an equivalent dict.
+        """
+        key = self._key('optimize', canonical(dct))
+        if key is None:
+            return optimizer.optimize(dct)
+        return self._get(key, lambda: optimizer.optimize(self.parse(dct)))
+
+    def compile(self, expression: Union[Expression, Term, Dict], on_error: str = 'raise',
+                optimize: bool = True, fields: List[str] = None) -> Callable:
+        """
+        Return compiler.compile(expression, on_error, optimize, fields), reusing the
+        predicate compiled for an equivalent dict.  Expressions that are not
+        dicts are compiled without caching.
+        """
+        if not isinstance(expression, dict):
+            return compiler.compile(expression, on_error, optimize, fields)
+        key = self._key('compile', canonical(expression), on_error, optimize,
+                        None if fields is None else tuple(fields))
+        if key is None:
+            return compiler.compile(expression, on_error, optimize, fields)
+        return self._get(key, lambda: compiler.compile(self.parse(expression), on_error,
+                                                        optimize, fields))
+
+    def resize(self, maxsize: int) -> None:
+        """
+        Change the maximum number of entries, evicting the least recently used.
+        """
+        with self._lock:
+            self.maxsize = maxsize
+            while len(self._entries) > max(maxsize, 0):
+                self._entries.popitem(last=False)
+
+    def clear(self) -> None:
+        """
+        Remove all entries and reset the hit and miss counters.
+        """
+        with self._lock:
+            self._entries.clear()
+            self.hits = 0
+            self.misses = 0
+
+    def info(self) -> Dict:
+        """
+        Return the hit and miss counts, current size and maximum size.
+        """
+        with self._lock:
+            return {'hits': self.hits, 'misses': self.misses,
+                    'size': len(self._entries), 'maxsize': self.maxsize}
+
+
+# Cache used by filter.apply, CSV_filter and Table for filter dicts.
+default_cache = Expression_cache()
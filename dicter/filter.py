@@ -1,20 +1,96 @@
+from dicter.expression_cache import default_cache
 from dicter.expression import Expression, Term
-from dicter.parser import parse
-from typing import Union, Dict, List
+from dicter.table import Table
+from itertools import islice
+from typing import Union, Dict, Iterable, Iterator, List, Optional
 
 
-def apply(expression: Union[Expression, Term, Dict], records: List[Dict]) -> List[Dict]:
+def chunks(records: Iterable, size: int) -> Iterator[List]:
+    """
+    Split records into lists of size records.
+    Arguments:
+        records : iterable of records
+        size    : number of records in each chunk.  The last chunk may be shorter.
+    Returns:
+        iterator over the chunks
+    Raises:
+        ValueError if size is not positive
+    """
+    if size < 1:
+        raise ValueError("Chunk size must be positive. Got " + repr(size))
+    iterator = iter(records)
+    while True:
+        chunk = list(islice(iterator, size))
+        if not chunk:
+            return
+        yield chunk
+
+
+def apply(expression: Union[Expression, Term, Dict], records: List[Dict],
+          on_error: str = 'raise', chunk_size: Optional[int] = None) -> List[Dict]:
     """
     Filter records for those that match the expression.
     Arguments:
         expression  : expression to satisfy, or dict representing an expression
         records     : records to examine
+        on_error    : (optional) policy for values that cannot be converted to float.
+                      See compiler.ON_ERROR_POLICIES.
+        chunk_size  : (optional) if given, evaluate the expression on chunks of this
+                      many records with matches_batch, e.g. 8192
     Returns:
         sublist of records that satisfy the expression
+    Raises:
+        ValueError if chunk_size is given and on_error is not 'raise'
+
+    If expression is a dict, the dict is parsed to create an expression to apply.
+    The expression is compiled into a single predicate before records are examined.
+    Predicates compiled from dicts are reused through expression_cache.default_cache.
+    If records is a Table, e.g. one loaded from a column_cache.Column_cache, the
+    expression is evaluated on its columns instead.
+
+    Chunked evaluation makes one call per node for each chunk rather than
+    for each record, which is much faster than calling matches on every
+    record.  Whether it beats the compiled predicate depends on the filter,
+    the data and the machine, so compare the apply and apply_chunked
+    benchmarks before choosing.  Dicts are optimized before chunked evaluation.
+    """
+    if isinstance(records, Table):
+        try:
+            return list(records.where(records.mask(expression)).records())
+        except Exception:
+            pass    # Evaluation failed on some column - apply on_error row by row
+    if chunk_size is not None:
+        if on_error != 'raise':
+            raise ValueError("Chunked evaluation requires on_error='raise'. Got " +
+                             repr(on_error))
+        if isinstance(expression, dict):
+            expression = default_cache.optimize(expression)
+        ret = []
+        for chunk in chunks(records, chunk_size):
+            matched = expression.matches_batch(chunk).nonzero()[0]
+            ret.extend(map(chunk.__getitem__, matched.tolist()))
+        return ret
+    predicate = default_cache.compile(expression, on_error)
+    return [record for record in records if predicate(record)]
+
+
+def iapply(expression: Union[Expression, Term, Dict], records: Iterable[Dict],
+           limit: Optional[int] = None, on_error: str = 'raise') -> Iterator[Dict]:
+    """
+    Lazily filter records for those that match the expression.
+    Arguments:
+        expression  : expression to satisfy, or dict representing an expression
+        records     : iterable of records to examine, e.g. a csv.DictReader or generator
+        limit       : (optional) maximum number of matching records to yield
+        on_error    : (optional) policy for values that cannot be converted to float.
+                      See compiler.ON_ERROR_POLICIES.
+    Returns:
+        iterator over the records that satisfy the expression
 
-    If expression is a dict, the dict is parsed to create an expression to apply.  
+    Records are consumed only as matches are requested; once limit matches
+    have been produced no further records are read.
     """
-    if isinstance(expression, dict):  # Parse the expression
-        return apply(parse(expression), records)
-    else:
-        return [record for record in records if expression.matches(record)]
+    matches = filter(default_cache.compile(expression, on_error), records)
+    if limit is not None:
+        matches = islice(matches, limit)
+    return matches
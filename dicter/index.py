@@ -0,0 +1,226 @@
+#!/usr/bin/env python
+
+"""Recordsets with hash and sorted indexes for sub-linear filtering."""
+
+from bisect import bisect_left, bisect_right
+from heapq import merge
+from typing import Dict, Iterable, Iterator, List, Optional, Set, Union
+import math
+from dicter.expression import Expression, Match_Type, NUMERIC_TYPES, Term, conj
+from dicter.compiler import compile
+from dicter.expression_cache import default_cache
+from dicter.optimizer import optimize, term_interval
+from dicter.parser import Parse_error
+
+# Pending entries are inserted one by one while there are at least this many
+# indexed entries per pending entry, and merged in one pass otherwise.
+INSERT_RATIO = 64
+
+
+def _predicate(expression: Union[Expression, Term], on_error: str):
+    """
+    Return the unoptimized predicate for expression, reusing the predicate in
+    default_cache for its dict form.  Expressions with no dict form are compiled.
+    """
+    try:
+        dct = expression.to_dict()
+        return default_cache.compile(dct, on_error, False)
+    except (AttributeError, TypeError, Parse_error):
+        return compile(expression, on_error, False)
+
+
+class _Sorted_index:
+    """
+    Row ids of the records holding a float value for a key, ordered by that value.
+    """
+
+    def __init__(self) -> None:
+        self.values = []
+        self.ids = []
+        self._pending = []
+        self.valid = True   # False once a value that cannot be converted to float is seen
+
+    def add(self, value, row_id: int) -> None:
+        try:
+            number = float(value)
+        except (TypeError, ValueError):
+            self.valid = False
+            return
+        if not math.isnan(number):   # NaN satisfies no comparison
+            self._pending.append((number, row_id))
+
+    def _merge(self) -> None:
+        """
+        Move the pending entries into the sorted lists.  A few entries are
+        inserted in place; many are sorted and merged in one linear pass.
+        """
+        if not self._pending:
+            return
+        self._pending.sort()
+        if len(self._pending) * INSERT_RATIO <= len(self.values):
+            for number, row_id in self._pending:
+                i = bisect_right(self.values, number)
+                self.values.insert(i, number)
+                self.ids.insert(i, row_id)
+        else:
+            pairs = list(merge(zip(self.values, self.ids), self._pending))
+            self.values = [value for value, _ in pairs]
+            self.ids = [row_id for _, row_id in pairs]
+        self._pending = []
+
+    def lookup(self, term: Term) -> Set[int]:
+        """
+        Return the ids of the rows satisfying a numeric term.
+        """
+        self._merge()
+        interval = term_interval(term)
+        # An unbounded end is closed at -inf or inf, so it starts or ends the slice
+        if interval.low_closed:
+            start = bisect_left(self.values, interval.low)
+        else:
+            start = bisect_right(self.values, interval.low)
+        if interval.high_closed:
+            end = bisect_right(self.values, interval.high)
+        else:
+            end = bisect_left(self.values, interval.high)
+        return set(self.ids[start:end])
+
+
+class Indexed_recordset:
+    """
+    A list of records with indexes that answer filters without a full scan.
+
+    Hash indexes on hash_keys answer $eq and $in terms.  Sorted indexes on
+    sorted_keys answer $lt, $le, $gt, $ge, $feq and range terms by binary
+    search.  Indexes are updated incrementally as records are appended.
+
+    apply() answers the indexable parts of an expression by intersecting and
+    uniting sets of row ids, and scans only the candidate rows for the
+    remaining terms.  Expressions with no indexable part are scanned in full.
+    A sorted index on a key holding a value that cannot be converted to float
+    is not used, so such filters behave as they do in filter.apply.
+    """
+
+    def __init__(self, records: Iterable[Dict] = (), hash_keys: Iterable[str] = (),
+                 sorted_keys: Iterable[str] = ()) -> None:
+        """
+        Create an indexed recordset.
+        Arguments:
+            records     : (optional) initial records
+            hash_keys   : (optional) keys to index for equality and list inclusion
+            sorted_keys : (optional) keys to index for numeric comparisons
+        """
+        self.records = []
+        self.hash_indexes = {key: {} for key in hash_keys}
+        self.sorted_indexes = {key: _Sorted_index() for key in sorted_keys}
+        self.extend(records)
+
+    def __len__(self) -> int:
+        return len(self.records)
+
+    def __iter__(self) -> Iterator[Dict]:
+        return iter(self.records)
+
+    def append(self, record: Dict) -> None:
+        """
+        Add a record, updating the indexes.
+        """
+        row_id = len(self.records)
+        self.records.append(record)
+        for key, index in self.hash_indexes.items():
+            if key in record:
+                try:
+                    index.setdefault(record[key], []).append(row_id)
+                except TypeError:   # unhashable values never equal hashable operands
+                    pass
+        for key, index in self.sorted_indexes.items():
+            if key in record:
+                index.add(record[key], row_id)
+
+    def extend(self, records: Iterable[Dict]) -> None:
+        for record in records:
+            self.append(record)
+
+    def _term_ids(self, term: Term) -> Optional[Set[int]]:
+        """
+        Return the ids of the rows satisfying term, or None if no index applies.
+        """
+        if term.key in self.hash_indexes:
+            index = self.hash_indexes[term.key]
+            if term.type == Match_Type.EQUALS:
+                try:
+                    return set(index.get(term.operand, ()))
+                except TypeError:
+                    return None
+            if term.type == Match_Type.IN and isinstance(term.operand, frozenset):
+                ret = set()
+                for value in term.operand:
+                    ret.update(index.get(value, ()))
+                return ret
+        if term.key in self.sorted_indexes and term.type in NUMERIC_TYPES:
+            index = self.sorted_indexes[term.key]
+            if index.valid and term_interval(term) is not None:
+                return index.lookup(term)
+        return None
+
+    def _ids(self, expression: Union[Expression, Term],
+             on_error: str) -> Optional[Set[int]]:
+        """
+        Return the ids of the rows satisfying expression, or None if the
+        expression has no indexable part.
+        """
+        if isinstance(expression, Term):
+            return self._term_ids(expression)
+        op = getattr(expression, 'op', None)
+        if op in ('$true', '$false'):
+            return set(range(len(self.records))) if op == '$true' else set()
+        if op == '$not':
+            ids = self._ids(expression.operands[0], on_error)
+            return None if ids is None else set(range(len(self.records))) - ids
+        if op == '$or':
+            ret = set()
+            for operand in expression.operands:
+                ids = self._ids(operand, on_error)
+                if ids is None:
+                    return None
+                ret |= ids
+            return ret
+        if op == '$and':
+            ret = None
+            residual = []
+            for operand in expression.operands:
+                ids = self._ids(operand, on_error)
+                if ids is None:
+                    residual.append(operand)
+                else:
+                    ret = ids if ret is None else ret & ids
+            if ret is None:
+                return None
+            if residual:
+                predicate = _predicate(residual[0] if len(residual) == 1 else conj(residual),
+                                       on_error)
+                ret = {i for i in ret if predicate(self.records[i])}
+            return ret
+        if op is None and isinstance(getattr(expression, 'term', None), Term):
+            return self._term_ids(expression.term)
+        return None
+
+    def apply(self, expression: Union[Expression, Term, Dict],
+              on_error: str = 'raise') -> List[Dict]:
+        """
+        Filter the records for those that match the expression.
+        Arguments:
+            expression  : expression to satisfy, or dict representing an expression
+            on_error    : (optional) policy for values that cannot be converted to float
+        Returns:
+            matching records, in the order they were added
+        """
+        if isinstance(expression, dict):
+            expression = default_cache.optimize(expression)
+        else:
+            expression = optimize(expression)
+        ids = self._ids(expression, on_error)
+        if ids is None:
+            predicate = _predicate(expression, on_error)
+            return [record for record in self.records if predicate(record)]
+        return [self.records[i] for i in sorted(ids)]
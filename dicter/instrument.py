@@ -0,0 +1,202 @@
+#!/usr/bin/env python
+
+"""Counts, pass rates and sampled timings for the nodes of Expression trees."""
+
+from time import perf_counter
+from typing import Callable, Dict, List, Tuple, Union
+from dicter.expression import SYMBOLS, Expression, Interval, Match_Type, Term
+from dicter.parser import parse
+
+
+def _operand_label(term: Term) -> str:
+    if term.type == Match_Type.REGEX:
+        return repr(term.operand.pattern)
+    if isinstance(term.operand, frozenset):
+        return repr(sorted(term.operand, key=repr))
+    if isinstance(term.operand, Interval):
+        interval = term.operand
+        return ('[' if interval.low_closed else '(') + repr(interval.low) + ', ' + \
+            repr(interval.high) + (']' if interval.high_closed else ')')
+    return repr(term.operand)
+
+
+class Profile_node:
+    """
+    Statistics gathered for one node of an instrumented expression.
+
+    evaluations counts the calls that reached the node and passes the calls
+    that returned true, so short-circuited operands show fewer evaluations
+    than their parent.  One evaluation in every sample_interval is timed;
+    time() scales the sampled total up to all evaluations.  The time of a
+    composite node includes the time of its children.
+    """
+
+    def __init__(self, label: str, children: List['Profile_node'] = ()) -> None:
+        self.label = label
+        self.children = list(children)
+        self.evaluations = 0
+        self.passes = 0
+        self.samples = 0
+        self.sampled_time = 0.0
+
+    def pass_rate(self) -> float:
+        """
+        Return the fraction of evaluations that returned true, or NaN if there were none.
+        """
+        return self.passes / self.evaluations if self.evaluations else float('nan')
+
+    def time(self) -> float:
+        """
+        Return the estimated total time in seconds spent evaluating the node.
+        """
+        if not self.samples:
+            return 0.0
+        return self.sampled_time * self.evaluations / self.samples
+
+    def reset(self) -> None:
+        self.evaluations = 0
+        self.passes = 0
+        self.samples = 0
+        self.sampled_time = 0.0
+        for child in self.children:
+            child.reset()
+
+    def to_dict(self) -> Dict:
+        """
+        Return the statistics of the node and its children as plain data,
+        suitable for json.  pass_rate is None if the node was never evaluated.
+        """
+        return {
+            'node': self.label,
+            'evaluations': self.evaluations,
+            'passes': self.passes,
+            'pass_rate': self.pass_rate() if self.evaluations else None,
+            'samples': self.samples,
+            'time': self.time(),
+            'children': [child.to_dict() for child in self.children]
+        }
+
+    def report(self, indent: int = 0) -> str:
+        """
+        Return a text report of the node and its children, one line per node.
+        """
+        line = '%s%s  evaluated %d  passed %d (%.1f%%)  time %.6fs' % (
+            '  ' * indent, self.label, self.evaluations, self.passes,
+            100 * self.pass_rate() if self.evaluations else 0.0, self.time())
+        return '\n'.join([line] + [child.report(indent + 1) for child in self.children])
+
+
+def _instrument(expression: Union[Expression, Term],
+                sample_interval: int) -> Tuple[Callable[[Dict], bool], Profile_node]:
+    """
+    Return an instrumented evaluation function for expression and its Profile_node.
+    """
+    op = getattr(expression, 'op', None)
+    if isinstance(expression, Term) or (
+            op is None and isinstance(getattr(expression, 'term', None), Term)):
+        term = expression if isinstance(expression, Term) else expression.term
+        node = Profile_node(SYMBOLS[term.type] + ' ' + repr(term.key) + ' ' +
+                            _operand_label(term))
+        inner = term.matches
+    elif op in ('$and', '$or', '$not'):
+        evaluators, children = zip(*[_instrument(operand, sample_interval)
+                                     for operand in expression.operands])
+        node = Profile_node(op, children)
+        if op == '$not':
+            operand = evaluators[0]
+
+            def inner(record: Dict) -> bool:
+                return not operand(record)
+        elif op == '$and':
+            def inner(record: Dict) -> bool:
+                for operand in evaluators:
+                    if not operand(record):
+                        return False
+                return True
+        else:
+            def inner(record: Dict) -> bool:
+                for operand in evaluators:
+                    if operand(record):
+                        return True
+                return False
+    elif op in ('$true', '$false'):
+        node = Profile_node(op)
+        inner = expression.matches
+    else:
+        node = Profile_node(type(expression).__name__)
+        inner = expression.matches
+
+    def evaluate(record: Dict) -> bool:
+        node.evaluations += 1
+        if (node.evaluations - 1) % sample_interval == 0:
+            start = perf_counter()
+            result = inner(record)
+            node.sampled_time += perf_counter() - start
+            node.samples += 1
+        else:
+            result = inner(record)
+        if result:
+            node.passes += 1
+        return result
+    return evaluate, node
+
+
+class Instrumented_expression(Expression):
+    """
+    An expression that records, for each node of another expression, how often
+    it was evaluated, how often it was true and a sample of its evaluation times.
+
+    The instrumented tree keeps the short-circuit order of the original, so
+    the counts show which operands decide the result.  Instrumented
+    expressions have no op, so compilers and Tables evaluate them through
+    matches; the original expression is not modified and runs without
+    overhead when used directly.
+    """
+
+    def __init__(self, expression: Union[Expression, Term], sample_interval: int = 100) -> None:
+        """
+        Instrument expression.
+        Arguments:
+            expression      : expression to instrument
+            sample_interval : (optional) time one evaluation of each node in this many
+        """
+        super().__init__(None)
+        self.expression = expression
+        self.matches, self.profile = _instrument(expression, sample_interval)
+
+    def reset(self) -> None:
+        """
+        Clear the statistics.
+        """
+        self.profile.reset()
+
+    def report(self) -> str:
+        """
+        Return a text report with one indented line per node.
+        """
+        return self.profile.report()
+
+    def to_dict(self) -> Dict:
+        """
+        Return the statistics as nested dicts, one per node.
+        """
+        return self.profile.to_dict()
+
+
+def instrument(expression: Union[Expression, Term, Dict],
+               sample_interval: int = 100) -> Instrumented_expression:
+    """
+    Create an instrumented version of an expression.
+    Arguments:
+        expression      : expression to instrument, or dict representing an expression
+        sample_interval : (optional) time one evaluation of each node in this many
+    Returns:
+        Instrumented_expression.  Evaluate it with filter.apply or matches and
+        read the statistics with report or to_dict.
+
+    The statistics are updated as matches is called, so the returned
+    expression should not be shared between threads.
+    """
+    if isinstance(expression, dict):
+        expression = parse(expression)
+    return Instrumented_expression(expression, sample_interval)
@@ -0,0 +1,306 @@
+#!/usr/bin/env python
+
+"""Scans csv files as bytes through a memory map."""
+
+import csv
+import mmap
+from itertools import accumulate
+from typing import Dict, Iterator, List, Tuple, Union
+from dicter.expression import Expression, Match_Type, Term, terms
+from dicter.expression_cache import default_cache
+
+# Size in bytes of the blocks of the map split into records at a time.
+SCAN_BLOCK_SIZE = 1 << 20
+
+
+def _is_transparent(expression: Union[Expression, Term]) -> bool:
+    """
+    Return true if expression reads records only through its Terms.
+    """
+    if isinstance(expression, Term):
+        return True
+    op = getattr(expression, 'op', None)
+    if op in ('$true', '$false'):
+        return True
+    if op in ('$and', '$or', '$not'):
+        return all(_is_transparent(operand) for operand in expression.operands)
+    return isinstance(getattr(expression, 'term', None), Term)
+
+
+def _term_literals(term: Term) -> Tuple[bytes, ...]:
+    """
+    Return byte strings one of which must occur in the text of any record
+    satisfying term, or None if there are none.
+    """
+    if term.type in (Match_Type.EQUALS, Match_Type.STARTS_WITH, Match_Type.ENDS_WITH):
+        values = [term.operand]
+    elif term.type == Match_Type.IN and isinstance(term.operand, frozenset):
+        values = list(term.operand)
+    else:
+        # $substr tests whether the field is contained in the operand,
+        # so the operand need not occur in the record.
+        return None
+    # Fields with quotes are escaped in the csv text, and the empty string
+    # is contained in every record.
+    if not values or not all(isinstance(value, str) and value and '"' not in value
+                             for value in values):
+        return None
+    return tuple(value.encode('UTF8') for value in values)
+
+
+def required_literals(expression: Union[Expression, Term]) -> List[Tuple[bytes, ...]]:
+    """
+    Return literal pre-checks for expression.
+    Arguments:
+        expression : parsed expression
+    Returns:
+        list of tuples of byte strings.  The text of every record satisfying
+        expression contains at least one byte string from each tuple.
+    """
+    if isinstance(expression, Term):
+        literals = _term_literals(expression)
+        return [] if literals is None else [literals]
+    op = getattr(expression, 'op', None)
+    if op == '$and':
+        return [literals for operand in expression.operands
+                for literals in required_literals(operand)]
+    if op == '$or':
+        alternatives = []
+        for operand in expression.operands:
+            required = required_literals(operand)
+            if not required:
+                return []
+            alternatives.extend(required[0])
+        return [tuple(dict.fromkeys(alternatives))] if alternatives else []
+    if op is None and isinstance(getattr(expression, 'term', None), Term):
+        return required_literals(expression.term)
+    return []
+
+
+class Mmap_reader:
+    """
+    Reads the records of a csv file by scanning a read-only memory map of it.
+
+    The map is split into records a block at a time, and a record is decoded
+    only if it contains the literals that the filter requires (see
+    required_literals).  Unquoted records are split as bytes and only the
+    fields the filter reads are decoded to str.  Matching
+    records are returned as memoryview slices of the map, with adjacent
+    records coalesced, so the output is byte-identical to the input.
+
+    The map shares the operating system page cache, so repeated filters of
+    the same file, from this reader or another process, do not copy it.
+    """
+
+    def __init__(self, path: str) -> None:
+        """
+        Map the csv file at path and read its header.
+        """
+        self.path = path
+        self._file = open(path, 'rb')
+        try:
+            self._map = mmap.mmap(self._file.fileno(), 0, access=mmap.ACCESS_READ)
+        except ValueError:  # Empty files cannot be mapped
+            self._map = b''
+        self._view = memoryview(self._map)
+        self.rows_read = 0
+        self.rows_written = 0
+        self.field_names = None
+        self.header_end = 0
+        for texts, starts in self._batches(0):
+            first = next((i for i, text in enumerate(texts) if text.strip(b'\r')), None)
+            if first is not None:
+                self.field_names = self._split(texts[first], None)
+                self.header_end = min(starts[first + 1], len(self._map))
+                break
+
+    def close(self) -> None:
+        self._view.release()
+        if isinstance(self._map, mmap.mmap):
+            self._map.close()
+        self._file.close()
+
+    def __enter__(self) -> 'Mmap_reader':
+        return self
+
+    def __exit__(self, *args) -> None:
+        self.close()
+
+    def header(self) -> memoryview:
+        """
+        Return the text of the header record, with its line ending.
+        """
+        return self._view[:self.header_end]
+
+    def _batches(self, pos: int) -> Iterator[Tuple[List[bytes], List[int]]]:
+        """
+        Iterate over the records at or after pos, a block at a time.
+        Returns:
+            iterator over (texts, starts), where texts holds the text of the
+            records in a block without line endings, and record i spans bytes
+            [starts[i], starts[i + 1]) of the map.  Blank lines are included
+            as records with empty or carriage return text.
+        """
+        data = self._map
+        size = len(data)
+        block_size = SCAN_BLOCK_SIZE
+        while pos < size:
+            stop = min(pos + block_size, size)
+            if stop < size:
+                newline = data.rfind(b'\n', pos, stop)
+                if newline < 0:
+                    block_size *= 2
+                    continue
+                stop = newline + 1
+            block = data[pos:stop]
+            lines = block.split(b'\n')
+            if not lines[-1]:
+                lines.pop()     # Empty text after the last newline
+            # A line with an odd number of quotes continues on the next line
+            if b'"' not in block or not any(line.count(b'"') % 2 for line in lines):
+                starts = list(accumulate(map(len, lines), lambda offset, n: offset + n + 1,
+                                         initial=pos))
+                block_size = SCAN_BLOCK_SIZE
+                pos = stop
+                yield lines, starts
+                continue
+            # Some quoted field holds a newline, so records must be joined
+            texts = []
+            starts = []
+            offset = pos
+            i = 0
+            count = len(lines)
+            while i < count:
+                line = lines[i]
+                start = offset
+                offset += len(line) + 1
+                i += 1
+                quotes = line.count(b'"')
+                if quotes % 2:
+                    parts = [line]
+                    while quotes % 2 and i < count:
+                        line = lines[i]
+                        offset += len(line) + 1
+                        i += 1
+                        parts.append(line)
+                        quotes += line.count(b'"')
+                    if quotes % 2 and stop < size:
+                        offset = start   # The record continues past the block
+                        break
+                    line = b'\n'.join(parts)
+                texts.append(line)
+                starts.append(start)
+            if offset == pos:
+                block_size *= 2    # A record longer than the block
+                continue
+            starts.append(offset)
+            block_size = SCAN_BLOCK_SIZE
+            pos = offset
+            yield texts, starts
+
+    @staticmethod
+    def _split(text: bytes, needed: List[int]) -> List:
+        """
+        Return the fields of a record.  If needed is not None, unquoted records
+        decode only the fields at the positions in needed.
+        """
+        if b'"' in text:
+            return next(csv.reader((text.decode('UTF8'),)))
+        if text.endswith(b'\r'):
+            text = text[:-1]
+        if needed is None:
+            return text.decode('UTF8').split(',')
+        row = text.split(b',')
+        width = len(row)
+        for i in needed:
+            if i < width:
+                row[i] = row[i].decode('UTF8')
+        return row
+
+    def records(self) -> Iterator[Tuple[int, int, List[str]]]:
+        """
+        Iterate over the records after the header.
+        Returns:
+            iterator over (start, end, row), where bytes [start, end) of the file
+            hold the record, including its line ending, and row holds its fields
+            padded with None to the width of the header
+        """
+        if self.field_names is None:
+            return
+        width = len(self.field_names)
+        size = len(self._map)
+        for texts, starts in self._batches(self.header_end):
+            indexes = [i for i, text in enumerate(texts) if text.strip(b'\r')]
+            rows = csv.reader(texts[i].decode('UTF8') for i in indexes)
+            for i, row in zip(indexes, rows):
+                if len(row) < width:
+                    row += [None] * (width - len(row))
+                yield starts[i], min(starts[i + 1], size), row
+
+    def ranges(self, dct: Dict, on_error: str = 'raise') -> Iterator[memoryview]:
+        """
+        Iterate over the text of the records satisfying the expression represented
+        by dct, as memoryview slices of the map.
+        Arguments:
+            dct      : dictionary representing a filter expression
+            on_error : (optional) policy for values that cannot be converted to float
+        Returns:
+            iterator over slices holding runs of consecutive matching records
+
+        self.rows_read and self.rows_written count the records scanned and
+        matched so far.  Records that fail a literal pre-check are not
+        evaluated, so they raise no conversion errors.  Slices must be
+        released before the reader is closed.
+        """
+        expression = default_cache.parse(dct)
+        self.rows_read = 0
+        self.rows_written = 0
+        field_names = self.field_names
+        if field_names is None:
+            default_cache.compile(dct, on_error)   # Report errors even for empty files
+            return
+        width = len(field_names)
+        predicate = default_cache.compile(dct, on_error, fields=field_names)
+        positions = {field: i for i, field in enumerate(field_names)}
+        if _is_transparent(expression):
+            needed = sorted({positions[term.key] for term in terms(expression)
+                             if term.key in positions})
+        else:
+            needed = list(range(width))
+        required = required_literals(expression)
+        split = self._split
+        size = len(self._map)
+        run_start = run_end = None
+        for texts, starts in self._batches(self.header_end):
+            self.rows_read += len(texts) - texts.count(b'') - texts.count(b'\r')
+            candidates = range(len(texts))
+            for literals in required:
+                if len(literals) == 1:
+                    literal = literals[0]
+                    candidates = [i for i in candidates if literal in texts[i]]
+                else:
+                    candidates = [i for i in candidates
+                                  if any(literal in texts[i] for literal in literals)]
+            # Quoted records are parsed by one csv.reader per block
+            quoted_rows = csv.reader(texts[i].decode('UTF8') for i in candidates
+                                     if b'"' in texts[i])
+            for i in candidates:
+                text = texts[i]
+                if b'"' in text:
+                    row = next(quoted_rows)
+                elif len(text) < 2 and not text.strip(b'\r'):
+                    continue    # Blank line
+                else:
+                    row = split(text, needed)
+                if len(row) < width:
+                    row += [None] * (width - len(row))
+                if predicate(row):
+                    self.rows_written += 1
+                    start = starts[i]
+                    if start != run_end:
+                        if run_start is not None:
+                            yield self._view[run_start:run_end]
+                        run_start = start
+                    run_end = min(starts[i + 1], size)
+        if run_start is not None:
+            yield self._view[run_start:run_end]
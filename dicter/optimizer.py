@@ -0,0 +1,253 @@
+#!/usr/bin/env python
+
+"""Rewrites parsed Expressions into cheaper equivalent Expressions."""
+
+from collections import OrderedDict
+from typing import Dict, List, Union
+import math
+from dicter.expression import Expression, Interval, Match_Type, NUMERIC_TYPES, Term, \
+    conj, const, disj, neg
+from dicter.parser import parse
+
+# Relative cost of evaluating a term of each match type.
+COSTS = {
+    Match_Type.EQUALS: 1,
+    Match_Type.IN: 1,
+    Match_Type.STARTS_WITH: 2,
+    Match_Type.ENDS_WITH: 2,
+    Match_Type.SUBSTRING: 2,
+    Match_Type.LESS_THAN: 3,
+    Match_Type.GREATER_THAN: 3,
+    Match_Type.LESS_THAN_OR_EQUAL: 3,
+    Match_Type.GREATER_THAN_OR_EQUAL: 3,
+    Match_Type.FLOAT_EQUALS: 3,
+    Match_Type.RANGE: 3,
+    Match_Type.REGEX: 10
+}
+
+# Cost assumed for expressions that can only be evaluated through their matches function.
+OPAQUE_COST = 20
+
+
+def term_interval(term: Term) -> Interval:
+    """
+    Return the interval of values satisfying a numeric term, or None if term is not
+    a numeric comparison with a well-defined interval.
+    """
+    if term.type == Match_Type.RANGE:
+        return term.operand
+    if term.type not in NUMERIC_TYPES or math.isnan(term.operand):
+        return None
+    c = term.operand
+    return {
+        Match_Type.LESS_THAN: lambda: Interval(high=c, high_closed=False),
+        Match_Type.LESS_THAN_OR_EQUAL: lambda: Interval(high=c, high_closed=True),
+        Match_Type.GREATER_THAN: lambda: Interval(low=c, low_closed=False),
+        Match_Type.GREATER_THAN_OR_EQUAL: lambda: Interval(low=c, low_closed=True),
+        Match_Type.FLOAT_EQUALS: lambda: Interval(c, c, True, True)
+    }[term.type]()
+
+
+def _members(term: Term) -> frozenset:
+    """
+    Return the set of values an $eq or $in term accepts, or None if the term
+    is not a set-membership test.
+    """
+    if term.type == Match_Type.IN and isinstance(term.operand, frozenset):
+        return term.operand
+    if term.type == Match_Type.EQUALS:
+        try:
+            return frozenset([term.operand])
+        except TypeError:
+            return None
+    return None
+
+
+def _atom(expression: Expression) -> Term:
+    """
+    Return the Term of an atomic expression, or None for other expressions.
+    """
+    if getattr(expression, 'op', None) is None and isinstance(
+            getattr(expression, 'term', None), Term):
+        return expression.term
+    return None
+
+
+def cost(expression: Union[Expression, Term]) -> int:
+    """
+    Estimate the cost of evaluating expression against one record.
+    """
+    if isinstance(expression, Term):
+        return COSTS[expression.type]
+    op = getattr(expression, 'op', None)
+    if op in ('$true', '$false'):
+        return 0
+    if op in ('$and', '$or', '$not'):
+        return sum(cost(operand) for operand in expression.operands)
+    if isinstance(getattr(expression, 'term', None), Term):
+        return COSTS[expression.term.type]
+    return OPAQUE_COST
+
+
+def can_raise(expression: Union[Expression, Term]) -> bool:
+    """
+    Return true unless evaluating expression can never raise an exception.
+
+    Only $eq, $in and constant terms, and combinations of them, are known not
+    to raise: numeric comparisons fail on non-numeric values, and string
+    conditions and regular expressions fail on missing (None) values.
+    """
+    if isinstance(expression, Term):
+        return expression.type not in (Match_Type.EQUALS, Match_Type.IN)
+    op = getattr(expression, 'op', None)
+    if op in ('$true', '$false'):
+        return False
+    if op in ('$and', '$or', '$not'):
+        return any(can_raise(operand) for operand in expression.operands)
+    if isinstance(getattr(expression, 'term', None), Term):
+        return can_raise(expression.term)
+    return True
+
+
+def _order(operands: List[Expression]) -> List[Expression]:
+    """
+    Return operands with those that cannot raise moved first, cheapest first.
+
+    Operands that can raise keep their original order after all the others,
+    so each is still evaluated only after every operand that preceded it,
+    and a guard such as a regex check before a numeric comparison still
+    protects it.
+    """
+    return sorted((operand for operand in operands if not can_raise(operand)), key=cost) + \
+        [operand for operand in operands if can_raise(operand)]
+
+
+def _merge_ranges(operands: List[Expression]) -> List[Expression]:
+    """
+    Replace the numeric comparisons on each key in a conjunction by one range check.
+    Returns [const(False)] if the comparisons on some key are contradictory.
+    """
+    intervals = OrderedDict()
+    for operand in operands:
+        term = _atom(operand)
+        interval = term_interval(term) if term is not None else None
+        if interval is not None:
+            intervals.setdefault(term.key, []).append(interval)
+    ret = []
+    merged = set()
+    for operand in operands:
+        term = _atom(operand)
+        if term is None or term.key not in intervals or term_interval(term) is None \
+                or len(intervals[term.key]) == 1:
+            ret.append(operand)
+        elif term.key not in merged:
+            merged.add(term.key)
+            interval = intervals[term.key][0]
+            for other in intervals[term.key][1:]:
+                interval = interval.intersect(other)
+            if interval.is_empty():
+                return [const(False)]
+            ret.append(Expression(Term(term.key, interval, Match_Type.RANGE)))
+    return ret
+
+
+def _merge_equals(operands: List[Expression]) -> List[Expression]:
+    """
+    Replace the $eq and $in terms on each key in a disjunction by one $in term.
+    """
+    members = OrderedDict()
+    for operand in operands:
+        term = _atom(operand)
+        values = _members(term) if term is not None else None
+        if values is not None:
+            members.setdefault(term.key, []).append(values)
+    ret = []
+    merged = set()
+    for operand in operands:
+        term = _atom(operand)
+        if term is None or term.key not in members or _members(term) is None \
+                or len(members[term.key]) == 1:
+            ret.append(operand)
+        elif term.key not in merged:
+            merged.add(term.key)
+            ret.append(Expression(Term(term.key, frozenset().union(*members[term.key]),
+                                       Match_Type.IN)))
+    return ret
+
+
+def _signature(expression: Expression):
+    """
+    Return a value identifying an atomic expression, or the expression itself otherwise.
+    """
+    term = _atom(expression)
+    if term is None:
+        return id(expression)
+    return (term.key, term.type, repr(term.operand))
+
+
+def _simplify(expression: Union[Expression, Term]) -> Expression:
+    """
+    Return a simplified copy of expression.
+    """
+    if isinstance(expression, Term):
+        return Expression(expression)
+    op = getattr(expression, 'op', None)
+    if op == '$not':
+        operand = _simplify(expression.operands[0])
+        inner = getattr(operand, 'op', None)
+        if inner == '$not':
+            return operand.operands[0]
+        if inner in ('$true', '$false'):
+            return const(inner == '$false')
+        return neg(operand)
+    if op not in ('$and', '$or'):
+        return expression
+    operands = []
+    for operand in expression.operands:
+        operand = _simplify(operand)
+        if getattr(operand, 'op', None) == op:
+            operands.extend(operand.operands)
+        else:
+            operands.append(operand)
+    operands = _merge_ranges(operands) if op == '$and' else _merge_equals(operands)
+    # Constant folding: a dominating constant decides the result,
+    # the identity constant can be dropped.
+    dominant, identity = ('$false', '$true') if op == '$and' else ('$true', '$false')
+    if any(getattr(operand, 'op', None) == dominant for operand in operands):
+        return const(dominant == '$true')
+    seen = set()
+    ret = []
+    for operand in operands:
+        signature = _signature(operand)
+        if getattr(operand, 'op', None) != identity and signature not in seen:
+            seen.add(signature)
+            ret.append(operand)
+    if not ret:
+        return const(identity == '$true')
+    if len(ret) == 1:
+        return ret[0]
+    ret = _order(ret)
+    return conj(ret) if op == '$and' else disj(ret)
+
+
+def optimize(expression: Union[Expression, Term, Dict]) -> Expression:
+    """
+    Rewrite an expression into an equivalent expression that is cheaper to evaluate.
+    Arguments:
+        expression : expression to optimize, or dict representing an expression
+    Returns:
+        optimized expression.  The input expression is not modified.
+
+    The rewrites are:
+      - nested $and / $or are flattened and double $not is removed
+      - numeric comparisons on the same key in a conjunction are merged into
+        one range check; an empty range makes the conjunction false
+      - $eq and $in terms on the same key in a disjunction are merged into one $in
+      - duplicate terms and constant operands are removed
+      - operands that cannot raise ($eq and $in terms) are moved first, cheapest
+        first; the others keep their written order, so a check written before a
+        numeric comparison still guards it
+    """
+    if isinstance(expression, dict):
+        expression = parse(expression)
+    return _simplify(expression)
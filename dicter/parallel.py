@@ -0,0 +1,187 @@
+#!/usr/bin/env python
+
+"""Filters csv files across several processes."""
+
+import csv
+import io
+from collections import deque
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
+from typing import Dict, List, Tuple, Union
+import os
+from dicter.expression import Expression
+from dicter.expression_cache import default_cache
+from dicter.rows import projection, raw_records, rows
+
+# Size in bytes of the blocks read while locating record boundaries.
+SCAN_BLOCK_SIZE = 1 << 20
+
+# Compiled predicate and output projection used by the current worker process.
+_predicate = None
+_project = None
+
+
+def record_boundaries(path: str, range_size: int) -> List[int]:
+    """
+    Split a csv file into byte ranges that start and end on record boundaries.
+    Arguments:
+        path        : path to the csv file
+        range_size  : approximate size in bytes of each range
+    Returns:
+        increasing list of offsets [header end, ..., file size]; consecutive
+        offsets delimit ranges holding whole records.  The list is empty if
+        the file holds no complete header.
+
+    A newline ends a record only if it is preceded by an even number of
+    double quotes, so newlines inside quoted fields are skipped.  Escaped
+    quotes ("") do not change the parity.
+    """
+    size = os.path.getsize(path)
+    boundaries = []
+    target = 0          # First offset at which to look for the next boundary
+    parity = 0          # Parity of the number of quotes before the scan position
+    offset = 0          # File offset of the current block
+    with open(path, 'rb') as input_file:
+        while target is not None:
+            block = input_file.read(SCAN_BLOCK_SIZE)
+            if not block:
+                break
+            i = 0       # Quotes in block[:i] are included in parity
+            while target is not None and target < offset + len(block):
+                nl = block.find(b'\n', max(i, target - offset))
+                if nl < 0:
+                    break
+                parity ^= block.count(b'"', i, nl) & 1
+                i = nl + 1
+                if parity == 0:
+                    boundaries.append(offset + i)
+                    target = offset + i + range_size
+                    if target >= size:
+                        target = None
+            parity ^= block.count(b'"', i) & 1
+            offset += len(block)
+    if boundaries and boundaries[-1] < size:
+        boundaries.append(size)
+    return boundaries
+
+
+def _init_worker(dct: Union[Expression, Dict], on_error: str, field_names: List[str],
+                 columns: List[str], passthrough: bool) -> None:
+    """
+    Compile the filter and output projection once in each worker process.
+    The projection is None if records are copied unchanged.
+    """
+    global _predicate, _project
+    _predicate = default_cache.compile(dct, on_error, fields=field_names)
+    _project = None if passthrough else projection(field_names, columns)[1]
+
+
+def _filter_range(path: str, start: int, end: int, width: int) -> Tuple[int, int, str]:
+    """
+    Filter the records in bytes [start, end) of path.
+    Arguments:
+        path    : path to the csv file
+        start   : offset of the first record in the range
+        end     : offset just past the last record in the range
+        width   : number of fields in the header
+    Returns:
+        tuple (rows read, rows written, csv text of the matching rows)
+    """
+    with open(path, 'rb') as input_file:
+        input_file.seek(start)
+        text = input_file.read(end - start).decode('UTF8')
+    rows_read = 0
+    rows_written = 0
+    if _project is None:
+        matched = []
+        for row, lines in raw_records(io.StringIO(text, newline=''), width):
+            rows_read += 1
+            if _predicate(row):
+                matched.extend(lines)
+                rows_written += 1
+        return rows_read, rows_written, ''.join(matched)
+    output = io.StringIO(newline='')
+    write = csv.writer(output).writerow
+    for row in rows(csv.reader(io.StringIO(text, newline='')), width):
+        rows_read += 1
+        if _predicate(row):
+            write(_project(row))
+            rows_written += 1
+    return rows_read, rows_written, output.getvalue()
+
+
+def filter_parallel(in_path: str, out_path: str, dct: Union[Expression, Dict], workers: int,
+                    ordered: bool = True, range_size: int = 1 << 26,
+                    buffer_size: int = -1, on_error: str = 'raise',
+                    columns: List[str] = None,
+                    passthrough: bool = False) -> Tuple[int, int]:
+    """
+    Filter in_path into out_path using a pool of worker processes.
+    Arguments:
+        in_path     : path to the csv input file
+        out_path    : path to the output file
+        dct         : expression, or dictionary representing a filter expression
+        workers     : number of worker processes
+        ordered     : (optional) if true, output rows keep their input order.
+                      Otherwise ranges are written as soon as they are done.
+        range_size  : (optional) approximate size in bytes of the ranges handed to workers
+        buffer_size : (optional) output buffer size in bytes
+        on_error    : (optional) policy for values that cannot be converted to float
+        columns     : (optional) columns to write, in order. Default is all columns.
+        passthrough : (optional) if true, copy the text of matching records unchanged
+    Returns:
+        tuple (rows read, rows written)
+
+    Each worker compiles dct against the input header once; expressions are
+    pickled to the workers as their node trees.  At most two
+    ranges per worker are in flight at any time, which bounds the memory
+    used by pending results.
+    """
+    default_cache.compile(dct, on_error)  # Report parse errors before starting any workers
+    boundaries = record_boundaries(in_path, range_size)
+    rows_read = 0
+    rows_written = 0
+    with open(out_path, 'w', encoding='UTF8', newline='',
+              buffering=buffer_size) as output_file:
+        if not boundaries:
+            return rows_read, rows_written
+        with open(in_path, 'rb') as input_file:
+            header = input_file.read(boundaries[0]).decode('UTF8')
+        field_names = next(csv.reader(io.StringIO(header, newline='')))
+        if passthrough:
+            output_file.write(header)
+        else:
+            csv.writer(output_file).writerow(projection(field_names, columns)[0])
+        with ProcessPoolExecutor(workers, initializer=_init_worker,
+                                 initargs=(dct, on_error, field_names, columns,
+                                           passthrough)) as executor:
+            pending = deque()
+
+            def drain(limit: int) -> Tuple[int, int]:
+                # Write finished ranges until at most limit are pending
+                read = 0
+                written = 0
+                while len(pending) > limit:
+                    if ordered:
+                        done = [pending.popleft()]
+                    else:
+                        finished, _ = wait(pending, return_when=FIRST_COMPLETED)
+                        done = [future for future in pending if future in finished]
+                        for future in done:
+                            pending.remove(future)
+                    for future in done:
+                        range_read, range_written, text = future.result()
+                        read += range_read
+                        written += range_written
+                        output_file.write(text)
+                return read, written
+
+            for start, end in zip(boundaries, boundaries[1:]):
+                pending.append(executor.submit(_filter_range, in_path, start, end,
+                                               len(field_names)))
+                read, written = drain(2 * workers - 1)
+                rows_read += read
+                rows_written += written
+            read, written = drain(0)
+            rows_read += read
+            rows_written += written
+    return rows_read, rows_written
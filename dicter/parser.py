@@ -1,20 +1,9 @@
-from typing import Dict
-from dicter.expression import Expression, Term, Match_Type, conj, disj, neg
+import json
+from typing import Dict, Union
+from dicter.expression import Expression, Term, Parse_error, SYMBOLS, conj, const, disj, neg
 
 # Map condition symbols to match types.
-MATCH_SYMBOLS = {
-    '$eq': Match_Type.EQUALS,
-    '$lt': Match_Type.LESS_THAN,
-    '$gt': Match_Type.GREATER_THAN,
-    '$le': Match_Type.LESS_THAN_OR_EQUAL,
-    '$ge': Match_Type.GREATER_THAN_OR_EQUAL,
-    '$substr': Match_Type.SUBSTRING,
-    '$startswith': Match_Type.STARTS_WITH,
-    '$endswith': Match_Type.ENDS_WITH,
-    '$feq': Match_Type.FLOAT_EQUALS,
-    '$re': Match_Type.REGEX,
-    '$in': Match_Type.IN
-}
+MATCH_SYMBOLS = {symbol: tp for tp, symbol in SYMBOLS.items()}
 
 # Map logic symbols to logical operators
 LOGIC_SYMBOLS = {
@@ -23,20 +12,11 @@ LOGIC_SYMBOLS = {
     '$not': neg
 }
 
-
-class Parse_error(Exception):
-    """
-    Exception raised when an error occurs parsing an input dictionary.
-    """
-
-    def __init__(self, msg: str = "") -> None:
-        """
-        Create a ParseError with the given error string.
-        Arguments:
-            msg : message string. Defaults to empty string.
-        """
-        super().__init__()
-        self.message = msg
+# Map constant symbols to truth values, e.g. {'$true': []}
+CONST_SYMBOLS = {
+    '$true': True,
+    '$false': False
+}
 
 
 def parse(dct: Dict) -> Expression:
@@ -62,6 +42,8 @@ def parse(dct: Dict) -> Expression:
         value = entry[attr]  # 'joe'
         comp = MATCH_SYMBOLS[key]  # Match_Type.EQUALS
         return Expression(Term(attr, value, comp))
+    if key in CONST_SYMBOLS:
+        return const(CONST_SYMBOLS[key])
     if key in LOGIC_SYMBOLS:
         # Composite case - recurse.
         # Example: {$or : [{'$eq : {'name': 'Bob'}}, {'$eq' : {'name': 'Sally'}]}
@@ -85,3 +67,39 @@ def parse(dct: Dict) -> Expression:
     else:
         # Could be atomic but with '$eq' (default) ommitted.  Try that.
         return parse({'$eq': dct})
+
+
+def to_json(expression: Union[Expression, Term, Dict]) -> str:
+    """
+    Return a compact JSON encoding of an expression, e.g. to store it on disk
+    or send it to another process.
+    Arguments:
+        expression : expression, term or dict representing an expression
+    Returns:
+        JSON text of the dict syntax, decoded by from_json.  Open ends of
+        ranges are written as null.
+    Raises:
+        TypeError if the expression cannot be written in the dict syntax
+        ValueError if the expression holds an infinite or NaN comparison value,
+        which strict JSON cannot represent
+    """
+    if not isinstance(expression, dict):
+        expression = expression.to_dict()
+    return json.dumps(expression, separators=(',', ':'), allow_nan=False)
+
+
+def from_json(text: Union[str, bytes]) -> Expression:
+    """
+    Create an expression from JSON text written by to_json.
+    Arguments:
+        text : JSON encoding of a dict representing a filter expression
+    Raises:
+        Parse_error if text is not valid
+    """
+    try:
+        dct = json.loads(text)
+    except ValueError as err:
+        raise Parse_error("Invalid JSON: " + str(err))
+    if not isinstance(dct, dict):
+        raise Parse_error("Expecting a JSON object. Got " + repr(dct))
+    return parse(dct)
@@ -0,0 +1,81 @@
+#!/usr/bin/env python
+
+"""Reads csv records as lists of fields rather than dicts."""
+
+import csv
+from operator import itemgetter
+from typing import Callable, Iterable, Iterator, List, Sequence, Tuple
+
+
+def rows(reader: Iterable[List[str]], width: int) -> Iterator[List[str]]:
+    """
+    Iterate over the rows of a csv.reader as csv.DictReader would see them.
+    Arguments:
+        reader : rows read by csv.reader, after the header
+        width  : number of fields in the header
+    Returns:
+        iterator over the non-blank rows, padded with None to at least width fields
+    """
+    for row in reader:
+        if len(row) < width:
+            if not row:
+                continue
+            row += [None] * (width - len(row))
+        yield row
+
+
+def raw_records(lines: Iterable[str], width: int = None) \
+        -> Iterator[Tuple[List[str], List[str]]]:
+    """
+    Iterate over csv records together with the lines of text they were parsed from.
+    Arguments:
+        lines : lines of csv text, with line endings, e.g. a file opened with newline=''
+        width : (optional) number of fields to pad rows to.
+                Default is the number of fields in the first record.
+    Returns:
+        iterator over (row, raw lines) for the non-blank records.  A quoted
+        field holding newlines makes a record span several lines.
+
+    The list of raw lines is reused for the next record, so consumers must
+    copy it (e.g. with list.extend) before advancing the iterator.
+    """
+    consumed = []
+
+    def source() -> Iterator[str]:
+        for line in lines:
+            consumed.append(line)
+            yield line
+
+    # csv.reader pulls exactly the lines of one record per row it returns
+    for row in csv.reader(source()):
+        if row:
+            if width is None:
+                width = len(row)
+            elif len(row) < width:
+                row += [None] * (width - len(row))
+            yield row, consumed
+        consumed.clear()
+
+
+def projection(field_names: List[str], columns: Sequence[str] = None) \
+        -> Tuple[List[str], Callable[[List[str]], Sequence[str]]]:
+    """
+    Return the output header and a function selecting the output fields of a row.
+    Arguments:
+        field_names : names of the fields in input rows
+        columns     : (optional) names of the fields to output, in order.
+                      Default is all fields of the input.
+    Raises:
+        ValueError if a column is not one of field_names
+    """
+    if columns is None:
+        width = len(field_names)
+        return list(field_names), lambda row: row if len(row) == width else row[:width]
+    unknown = [column for column in columns if column not in field_names]
+    if unknown:
+        raise ValueError("Unknown columns " + str(unknown))
+    positions = {field: i for i, field in enumerate(field_names)}
+    getter = itemgetter(*[positions[column] for column in columns])
+    if len(columns) == 1:
+        return list(columns), lambda row: (getter(row),)
+    return list(columns), getter
@@ -0,0 +1,244 @@
+#!/usr/bin/env python
+
+"""Columnar recordsets with vectorized filter evaluation."""
+
+import csv
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, Union
+import numpy as np
+from dicter.expression import CONDITIONS, NUMERIC_UFUNCS, Expression, Match_Type, Term
+from dicter.expression_cache import default_cache
+
+
+def _object_array(values: List) -> np.ndarray:
+    """
+    Return a one dimensional object array holding values.
+    """
+    ret = np.empty(len(values), dtype=object)
+    ret[:] = values
+    return ret
+
+
+class Table:
+    """
+    A recordset stored column by column.
+
+    Each column is kept as an object array of the original field values.
+    Float versions of columns are parsed the first time a numeric condition
+    or a statistic needs them and cached for later queries.  Rows that do not
+    have a key are recorded in a per-column missing mask.
+
+    Expressions are evaluated as boolean masks over whole columns:
+    $and maps to &, $or to |, $not to ~ and terms to vectorized comparisons.
+    String conditions other than simple equality are tested once per distinct
+    value of a column, using a dictionary encoding of the column that is
+    built on first use and cached like the float columns.
+    """
+
+    def __init__(self, columns: Dict[str, np.ndarray],
+                 missing: Dict[str, np.ndarray] = None,
+                 floats: Dict[str, np.ndarray] = None,
+                 encoded: Dict[str, Tuple[np.ndarray, np.ndarray]] = None) -> None:
+        """
+        Create a Table from equal length column arrays.
+        Arguments:
+            columns : dictionary with keys = column names and values = column arrays
+            missing : (optional) boolean arrays marking rows that lack a key
+            floats  : (optional) float64 versions of columns that are already parsed
+            encoded : (optional) dictionary encodings of columns, as returned by encoded
+        """
+        self.columns = columns
+        self.missing = missing if missing is not None else {}
+        self._floats = dict(floats) if floats is not None else {}
+        self._encoded = dict(encoded) if encoded is not None else {}
+        self._length = len(next(iter(columns.values()))) if columns else 0
+
+    @classmethod
+    def from_records(cls, records: Iterable[Dict]) -> 'Table':
+        """
+        Create a Table from an iterable of dicts.
+        """
+        records = list(records)
+        keys = dict.fromkeys(key for record in records for key in record)
+        columns = {}
+        missing = {}
+        for key in keys:
+            present = [key in record for record in records]
+            columns[key] = _object_array(
+                [record.get(key) for record in records])
+            if not all(present):
+                missing[key] = ~np.array(present, dtype=bool)
+        return cls(columns, missing)
+
+    @classmethod
+    def from_csv(cls, path: str) -> 'Table':
+        """
+        Create a Table from the csv file at path.  Empty rows are skipped and
+        short rows are padded with None, as csv.DictReader does.
+        """
+        with open(path, encoding='UTF8', newline='') as input_file:
+            reader = csv.reader(input_file)
+            field_names = next(reader, [])
+            width = len(field_names)
+            rows = [row if len(row) >= width else row + [None] * (width - len(row))
+                    for row in reader if row]
+        return cls({key: _object_array([row[i] for row in rows])
+                    for i, key in enumerate(field_names)})
+
+    def __len__(self) -> int:
+        return self._length
+
+    def __iter__(self) -> Iterator[Dict]:
+        return self.records()
+
+    def keys(self) -> List[str]:
+        return list(self.columns)
+
+    def records(self) -> Iterator[Dict]:
+        """
+        Iterate over the rows of the table as dicts.
+        """
+        keys = self.keys()
+        for i in range(self._length):
+            yield {key: self.columns[key][i] for key in keys
+                   if key not in self.missing or not self.missing[key][i]}
+
+    def floats(self, key: str) -> np.ndarray:
+        """
+        Return the column for key as a float64 array, parsing it on first use.
+        Rows without the key are NaN.
+        Raises:
+            TypeError if the column holds None, e.g. for short csv rows, which
+            float() rejects; ValueError if it holds other non-numeric values
+        """
+        if key not in self._floats:
+            values = self.columns[key]
+            if key in self.missing:
+                present = ~self.missing[key]
+                values = values[present]
+                numbers = np.array(values, dtype=np.float64)
+                ret = np.full(self._length, np.nan)
+                ret[present] = numbers
+            else:
+                numbers = ret = np.array(values, dtype=np.float64)
+            # NumPy converts None to NaN, where float(None) raises
+            if any(value is None for value in values[np.isnan(numbers)]):
+                raise TypeError("Column " + repr(key) + " holds None, which is not a number")
+            self._floats[key] = ret
+        return self._floats[key]
+
+    def encoded(self, key: str) -> Optional[Tuple[np.ndarray, np.ndarray]]:
+        """
+        Return the dictionary encoding of the column for key, computing it on first use.
+        Returns:
+            tuple (codes, values), where values is an object array of the distinct
+            values in the column and row i holds values[codes[i]], or code -1 if it
+            lacks the key.  None if the column holds unhashable values.
+        """
+        if key not in self._encoded:
+            values = self.columns[key]
+            index = {}
+            try:
+                if key in self.missing:
+                    present = ~self.missing[key]
+                    codes = np.full(self._length, -1, dtype=np.int32)
+                    codes[present] = np.fromiter(
+                        (index.setdefault(value, len(index)) for value in values[present]),
+                        dtype=np.int32, count=int(np.count_nonzero(present)))
+                else:
+                    codes = np.fromiter(
+                        (index.setdefault(value, len(index)) for value in values),
+                        dtype=np.int32, count=self._length)
+            except TypeError:
+                self._encoded[key] = None
+            else:
+                self._encoded[key] = codes, _object_array(list(index))
+        return self._encoded[key]
+
+    def _term_mask(self, term: Term) -> np.ndarray:
+        """
+        Return the mask of rows that satisfy term.
+        """
+        if term.key not in self.columns:
+            return np.zeros(self._length, dtype=bool)
+        if term.type in NUMERIC_UFUNCS:
+            # NaN entries for missing values compare false
+            return NUMERIC_UFUNCS[term.type](self.floats(term.key), term.operand)
+        if term.type == Match_Type.RANGE:
+            interval = term.operand
+            values = self.floats(term.key)
+            low = np.greater_equal if interval.low_closed else np.greater
+            high = np.less_equal if interval.high_closed else np.less
+            return low(values, interval.low) & high(values, interval.high)
+        simple = term.type == Match_Type.EQUALS and isinstance(term.operand, (str, int, float))
+        if not simple or term.key in self._encoded:
+            encoded = self.encoded(term.key)
+            if encoded is not None:
+                # Test each distinct value once and look the results up by code.
+                # The extra False entry is selected by code -1 for missing values.
+                codes, values = encoded
+                condition = CONDITIONS[term.type]
+                operand = term.operand
+                lookup = np.fromiter((bool(condition(value, operand)) for value in values),
+                                     dtype=bool, count=len(values))
+                return np.append(lookup, False)[codes]
+        values = self.columns[term.key]
+        present = None
+        if term.key in self.missing:
+            present = ~self.missing[term.key]
+            values = values[present]
+        if simple:
+            matched = np.asarray(values == term.operand, dtype=bool)
+        else:
+            condition = CONDITIONS[term.type]
+            operand = term.operand
+            matched = np.fromiter((bool(condition(value, operand)) for value in values),
+                                  dtype=bool, count=len(values))
+        if present is None:
+            return matched
+        ret = np.zeros(self._length, dtype=bool)
+        ret[present] = matched
+        return ret
+
+    def mask(self, expression: Union[Expression, Term, Dict]) -> np.ndarray:
+        """
+        Return a boolean array marking the rows that satisfy expression.
+        Arguments:
+            expression : expression to evaluate, or dict representing an expression
+        Returns:
+            boolean array with one entry per row
+
+        Dicts are parsed and then rewritten by optimizer.optimize.
+        """
+        if isinstance(expression, dict):
+            expression = default_cache.optimize(expression)
+        if isinstance(expression, Term):
+            return self._term_mask(expression)
+        op = getattr(expression, 'op', None)
+        if op in ('$true', '$false'):
+            return np.full(self._length, op == '$true')
+        if op == '$not':
+            return ~self.mask(expression.operands[0])
+        if op == '$and':
+            return np.logical_and.reduce([self.mask(operand) for operand in expression.operands])
+        if op == '$or':
+            return np.logical_or.reduce([self.mask(operand) for operand in expression.operands])
+        if isinstance(getattr(expression, 'term', None), Term):
+            return self._term_mask(expression.term)
+        # Opaque expression - evaluate it row by row
+        return np.fromiter((bool(expression.matches(record)) for record in self.records()),
+                           dtype=bool, count=self._length)
+
+    def where(self, expression: Union[Expression, Term, Dict, np.ndarray]) -> 'Table':
+        """
+        Return a new Table holding the rows that satisfy expression.
+        Arguments:
+            expression : expression, dict representing an expression, or boolean mask
+        """
+        mask = expression if isinstance(expression, np.ndarray) else self.mask(expression)
+        ret = Table({key: values[mask] for key, values in self.columns.items()},
+                    {key: values[mask] for key, values in self.missing.items()})
+        ret._floats = {key: values[mask] for key, values in self._floats.items()}
+        ret._encoded = {key: None if encoded is None else (encoded[0][mask], encoded[1])
+                        for key, encoded in self._encoded.items()}
+        ret._length = int(np.count_nonzero(mask))
+        return ret
@@ -0,0 +1,112 @@
+from pathlib import Path
+from dicter.column_cache import Column_cache
+from dicter.csv_filter import CSV_filter
+from dicter.filter import apply
+import csv
+import pytest
+
+WEATHER_FILE = Path(__file__).resolve().parent.parent / 'examples' / 'weather.csv'
+
+FILTERS = [
+    {'Station.State': 'Arizona'},
+    {'$and': [{'$in': {'Station.City': ['Phoenix', 'Tucson', 'Reno']}},
+              {'$gt': {'Data.Temperature.Max Temp': 90}}]},
+    {'$or': [{'$startswith': {'Station.City': 'San'}}, {'$lt': {'Data.Wind.Speed': 2}}]}
+]
+
+
+@pytest.fixture
+def weather(tmp_path):
+    path = tmp_path / 'weather.csv'
+    path.write_bytes(WEATHER_FILE.read_bytes())
+    return path
+
+
+def test_build_and_load(weather):
+    cache = Column_cache(weather)
+    assert(not cache.is_valid())
+    with pytest.raises(ValueError):
+        cache.table()
+    cache.build()
+    assert(cache.is_valid())
+    table = cache.table()
+    records = list(csv.DictReader(open(weather)))
+    assert(list(table.records()) == records)
+    assert(cache.meta()['numeric'][cache.meta()['columns'].index('Data.Wind.Speed')])
+    assert(not cache.meta()['numeric'][cache.meta()['columns'].index('Station.City')])
+    for dct in FILTERS:
+        assert(apply(dct, table) == apply(dct, records))
+
+
+def test_stale_cache(weather):
+    cache = Column_cache(weather).build()
+    with open(weather, 'a') as f:
+        f.write('"0.0","2017-01-01","1","1","2017","Reno","RNO","Reno, NV","Nevada",'
+                '"30","40","20","10","5"\n')
+    assert(not cache.is_valid())
+    read, written = CSV_filter(weather, weather.with_name('out.csv')) \
+        .stream_filtered_file({'Station.City': 'Reno'})
+    assert(read == len(list(csv.DictReader(open(weather)))))
+
+
+@pytest.mark.parametrize('dct', FILTERS)
+def test_csv_filter_uses_cache(weather, dct, monkeypatch):
+    columns = ['Data.Temperature.Max Temp', 'Data.Wind.Speed']
+    expected = {}
+    for passthrough in (True, False):
+        path = weather.with_name('expected_%s.csv' % passthrough)
+        counts = CSV_filter(weather, path, passthrough=passthrough).stream_filtered_file(dct)
+        expected[passthrough] = counts, path.read_bytes()
+    scanned = CSV_filter(weather, None).stats(dct, columns)
+    Column_cache(weather).build()
+
+    def fail(*args):
+        raise AssertionError("csv file scanned")
+    monkeypatch.setattr('dicter.csv_filter.rows', fail)
+    monkeypatch.setattr('dicter.csv_filter.raw_records', fail)
+    out_path = weather.with_name('out.csv')
+    for passthrough in (True, False):
+        counts = CSV_filter(weather, out_path, passthrough=passthrough).stream_filtered_file(dct)
+        assert((counts, out_path.read_bytes()) == expected[passthrough])
+    cached = CSV_filter(weather, None).stats(dct, columns)
+    for column in columns:
+        assert(cached[column].n() == scanned[column].n())
+        assert(cached[column].mean() == pytest.approx(scanned[column].mean()))
+        assert(cached[column].percentiles() == scanned[column].percentiles())
+
+
+def test_short_rows(tmp_path):
+    path = tmp_path / 'short.csv'
+    path.write_text('name,score\nBob,10\nSally\nPoo,30\n')
+    Column_cache(path).build()
+    assert(not Column_cache(path).meta()['numeric'][1])
+    dct = {'$not': {'$gt': {'score': 20}}}
+    for on_error in ('false', 'skip'):
+        counts = {}
+        for use_cache in (True, False):
+            out_path = tmp_path / ('out_%s.csv' % use_cache)
+            counts[use_cache] = CSV_filter(path, out_path, on_error=on_error,
+                                           use_cache=use_cache).stream_filtered_file(dct)
+            assert(out_path.read_text() ==
+                   open(tmp_path / 'out_True.csv').read())
+        assert(counts[True] == counts[False])
+    for use_cache in (True, False):
+        with pytest.raises(TypeError):
+            CSV_filter(path, tmp_path / 'out.csv', use_cache=use_cache).stream_filtered_file(dct)
+    with pytest.raises(TypeError):
+        Column_cache(path).table().floats('score')
+
+
+def test_string_condition_on_short_rows(tmp_path):
+    path = tmp_path / 'short.csv'
+    path.write_text('a,b,c\n1,x,q\n2,y\n3,z,r\n')
+    dct = {'$and': [{'a': '1'}, {'$startswith': {'c': 'q'}}]}
+    expected = {}
+    for use_cache in (False, True):
+        csv_filter = CSV_filter(path, tmp_path / 'out.csv', use_cache=use_cache)
+        assert(csv_filter.stream_filtered_file(dct) == (3, 1))
+        assert(open(tmp_path / 'out.csv').read() == 'a,b,c\n1,x,q\n')
+        expected[use_cache] = csv_filter.stats(dct, ['a'])['a'].n()
+        Column_cache(path).build()
+    assert(expected == {False: 1, True: 1})
+    assert(apply(dct, Column_cache(path).table()) == [{'a': '1', 'b': 'x', 'c': 'q'}])
@@ -0,0 +1,126 @@
+import pytest
+from dicter import compile
+from dicter.compiler import compile_many
+from dicter.expression import Expression, Match_Type, Term, conj, disj, neg
+
+RECORDS = [
+    {"name": 'Bob', "age": '12', "team": 'ducks'},
+    {"name": 'Sally', "age": '20', "team": 'bears'},
+    {"name": 'Clarence', "age": '30', "team": 'ducks'},
+    {"name": 'Maddie', "age": '40'},
+]
+
+
+def test_compiled_matches_expression():
+    expressions = [
+        Expression(Term('team', 'ducks')),
+        conj([Term('team', 'ducks'), Term('age', 20, Match_Type.GREATER_THAN)]),
+        disj([conj([Term('team', 'bears'), Term('name', 'Sally')]),
+              disj([Term('age', '12'), Term('name', 'Ma', Match_Type.STARTS_WITH)])]),
+        neg(Term('team', 'ducks')),
+        Expression(Term('name', r'[BC]', Match_Type.REGEX)),
+        Expression(Term('team', ['bears', 'geese'], Match_Type.IN)),
+        Expression(Term('age', 30.0, Match_Type.FLOAT_EQUALS)),
+    ]
+    for exp in expressions:
+        predicate = compile(exp)
+        for record in RECORDS:
+            assert(predicate(record) == bool(exp.matches(record)))
+
+
+def test_compile_dict():
+    predicate = compile({'$and': [{'$lt': {'age': 35}}, {'$not': {'team': 'ducks'}}]})
+    assert([r['name'] for r in RECORDS if predicate(r)] == ['Sally'])
+
+
+def test_compile_opaque_expression():
+    exp = Expression(None)
+    exp.matches = lambda record: record.get('team') == 'bears'
+    predicate = compile(disj([exp, Term('name', 'Bob')]))
+    assert([r['name'] for r in RECORDS if predicate(r)] == ['Bob', 'Sally'])
+
+
+def test_compile_many_shares_conversions():
+    conversions = []
+
+    class Value(str):
+        def __float__(self):
+            conversions.append(self)
+            return float(str(self))
+    predicates = compile_many([
+        {'$and': [{'$gt': {'age': 10}}, {'$lt': {'age': 35}}]},
+        {'$ge': {'age': 20}},
+        {'team': 'ducks'}])
+    assert(predicates({'age': Value('30'), 'team': 'bears'}) == (True, True, False))
+    assert(len(conversions) == 1)
+    assert(predicates({'team': 'ducks'}) == (False, False, True))
+
+
+def test_fetch_once():
+    fetched = []
+
+    class Record(dict):
+        def get(self, key, default=None):
+            fetched.append(key)
+            return super().get(key, default)
+
+        def __getitem__(self, key):
+            fetched.append(key)
+            return super().__getitem__(key)
+    predicate = compile({'$or': [{'$and': [{'$gt': {'wind': 15}}, {'$lt': {'wind': 40}}]},
+                                 {'$feq': {'wind': 50}},
+                                 {'$ge': {'avg_temp': 70}}]})
+    assert(predicate(Record({'wind': '45', 'avg_temp': '71'})))
+    assert(fetched == ['wind', 'avg_temp'])
+
+
+def test_on_error_policies():
+    records = [{'age': '12'}, {'age': 'unknown'}, {'age': None}, {}]
+    dct = {'$not': {'$gt': {'age': 10}}}
+    with pytest.raises(ValueError):
+        [r for r in records if compile(dct)(r)]
+    assert([r for r in records if compile(dct, 'false')(r)] == records[1:])
+    assert([r for r in records if compile(dct, 'skip')(r)] == records[3:])
+    assert(compile_many([dct, {'age': 'unknown'}], 'skip')(records[1]) == (False, False))
+    with pytest.raises(ValueError):
+        compile(dct, 'ignore')
+
+
+def test_compile_fields():
+    fields = ['name', 'age', 'team']
+    rows = [[record.get(field) for field in fields] for record in RECORDS]
+    dct = {'$or': [{'$gt': {'age': 25}}, {'team': 'bears'}, {'city': 'Reno'}]}
+    predicate = compile(dct, fields=fields)
+    assert([row[0] for row in rows if predicate(row)] == ['Sally', 'Clarence', 'Maddie'])
+    predicates = compile_many([{'team': 'ducks'}, {'$lt': {'age': 25}}], fields=fields)
+    assert([predicates(row) for row in rows] ==
+           [(True, True), (False, True), (True, False), (False, False)])
+
+
+def test_regex_memoized():
+    predicate = compile({'$re': {'team': 'd.*s'}})
+    memo = next(value for value in predicate.__globals__.values()
+                if hasattr(value, 'cache_info'))
+    assert([predicate(record) for record in RECORDS * 3 if 'team' in record] ==
+           [True, False, True] * 3)
+    assert(memo.cache_info().misses == 2)
+    assert(memo.cache_info().hits == 7)
+
+
+def test_deep_tree_on_error():
+    dct = {'$not': {'$gt': {'age': 10}}}
+    for depth in range(200):     # too deep to compile as one function
+        if depth % 2:
+            dct = {'$or': [{'name': 'n%d' % depth}, dct]}
+        else:
+            dct = {'$and': [{'$not': {'name': 'm%d' % depth}}, dct]}
+    records = [{'name': 'Bob', 'age': '12'}, {'name': 'Bob', 'age': 'unknown'}]
+    with pytest.raises(ValueError):
+        [r for r in records if compile(dct)(r)]
+    assert([r for r in records if compile(dct, 'false')(r)] == records[1:])
+    assert([r for r in records if compile(dct, 'skip')(r)] == [])
+    assert(compile_many([dct, {'name': 'Bob'}], 'skip')(records[1]) == (False, False))
+    assert(compile_many([dct, {'name': 'Bob'}], 'false')(records[1]) == (True, True))
+    fields = ['name', 'age']
+    predicate = compile(dct, 'false', fields=fields)
+    assert([predicate([r['name'], r['age']]) for r in records] == [False, True])
@@ -1,11 +1,15 @@
 from pathlib import Path
 from dicter.csv_filter import CSV_filter
+from dicter.filter import apply
+from dicter.parallel import record_boundaries
 import csv
 import os
+import pytest
 
 TEST_DATA_DIR = Path(__file__).resolve().parent / 'data'
 IN_FILE = TEST_DATA_DIR / 'in.csv'
 OUT_FILE = TEST_DATA_DIR / 'out.csv'
+WEATHER_FILE = Path(__file__).resolve().parent.parent / 'examples' / 'weather.csv'
 
 
 def test_filter():
@@ -40,3 +44,169 @@ def test_filter_regex():
         assert(' ' in input['Station.City'])
     assert(len(records) == 7)
     os.remove(OUT_FILE)
+
+
+def test_stream_filter():
+    csv_filter = CSV_filter(IN_FILE, OUT_FILE, buffer_size=4096)
+    rows_read, rows_written = csv_filter.stream_filtered_file(
+        {'$re': {'Station.City': r'\w+\s+\w+'}}
+    )
+    input_file = csv.DictReader(open(OUT_FILE))
+    records = list(input_file)
+    assert(rows_written == len(records) == 7)
+    assert(rows_read == len(list(csv.DictReader(open(IN_FILE)))))
+    assert(input_file.fieldnames == csv.DictReader(open(IN_FILE)).fieldnames)
+    os.remove(OUT_FILE)
+
+
+def test_stream_filter_no_matches():
+    csv_filter = CSV_filter(IN_FILE, OUT_FILE)
+    rows_read, rows_written = csv_filter.stream_filtered_file(
+        {'Station.City': 'Atlantis'})
+    assert(rows_written == 0)
+    assert(len(list(csv.DictReader(open(OUT_FILE)))) == 0)
+    os.remove(OUT_FILE)
+
+
+def test_record_boundaries(tmp_path):
+    path = tmp_path / 'quoted.csv'
+    path.write_text('a,b\n1,"x\ny"\n2,"say ""hi""\n"\n3,z', encoding='UTF8')
+    content = path.read_bytes()
+    boundaries = record_boundaries(path, 1)
+    assert(boundaries == [4, 12, 28, len(content)])
+
+
+def test_parallel_filter(tmp_path):
+    in_path = tmp_path / 'in.csv'
+    with open(in_path, 'w', encoding='UTF8', newline='') as f:
+        writer = csv.writer(f)
+        writer.writerow(['id', 'note'])
+        for i in range(500):
+            writer.writerow([i, 'line one\nline "two"' if i % 3 == 0 else 'plain'])
+    dct = {'$and': [{'$lt': {'id': 400}}, {'$substr': {'note': 'plain text'}}]}
+    expected = [r for r in csv.DictReader(open(in_path, newline=''))
+                if int(r['id']) < 400 and r['note'] == 'plain']
+    for ordered in [True, False]:
+        out_path = tmp_path / 'out.csv'
+        csv_filter = CSV_filter(in_path, out_path, workers=2, ordered=ordered,
+                                range_size=512)
+        assert(csv_filter.stream_filtered_file(dct) == (500, len(expected)))
+        records = list(csv.DictReader(open(out_path, newline='')))
+        if ordered:
+            assert(records == expected)
+        else:
+            assert(sorted(records, key=lambda r: int(r['id'])) == expected)
+
+
+def test_split_files(tmp_path):
+    filters = {
+        tmp_path / 'cold.csv': {'$lt': {'Data.Temperature.Min Temp': 30}},
+        tmp_path / 'cold_windy.csv': {'$and': [
+            {'$lt': {'Data.Temperature.Min Temp': 30}},
+            {'$gt': {'Data.Wind.Speed': 15}}]},
+        tmp_path / 'multi_word.csv': {'$re': {'Station.City': r'\w+\s+\w+'}}
+    }
+    counts = CSV_filter(IN_FILE, None).write_split_files(filters)
+    for path, dct in filters.items():
+        expected = apply(dct, csv.DictReader(open(IN_FILE)))
+        assert(list(csv.DictReader(open(path))) == expected)
+        assert(counts[path] == len(expected))
+    assert(counts[tmp_path / 'cold_windy.csv'] == 2)
+
+
+def test_stats():
+    dct = {'$and':
+           [
+               {'$or': [
+                   {'$gt': {'Data.Temperature.Max Temp': 100}},
+                   {'$gt': {'Data.Temperature.Min Temp': 80}}
+               ]},
+               {'$not': {'Station.State': 'Arizona'}}
+           ]}
+    columns = ['Data.Temperature.Max Temp', 'Data.Temperature.Min Temp']
+    csv_filter = CSV_filter(WEATHER_FILE, None)
+    exact = csv_filter.stats(dct, columns)
+    streaming = csv_filter.stats(dct, columns, streaming=True)
+    assert(exact['Data.Temperature.Max Temp'].n() == 94)
+    assert(exact['Data.Temperature.Min Temp'].percentile(90) == 82.0)
+    for column in columns:
+        assert(streaming[column].n() == exact[column].n())
+        assert(streaming[column].mean() == pytest.approx(exact[column].mean()))
+        assert(streaming[column].percentiles() == exact[column].percentiles())
+
+
+def test_stream_columns(tmp_path):
+    dct = {'$gt': {'Data.Wind.Speed': 15}}
+    columns = ['Station.City', 'Data.Wind.Speed']
+    out_path = tmp_path / 'out.csv'
+    read, written = CSV_filter(IN_FILE, out_path).stream_filtered_file(dct, columns)
+    expected = [{column: record[column] for column in columns}
+                for record in apply(dct, csv.DictReader(open(IN_FILE)))]
+    assert(list(csv.DictReader(open(out_path))) == expected)
+    assert(written == len(expected))
+    with pytest.raises(ValueError):
+        CSV_filter(IN_FILE, out_path).stream_filtered_file(dct, ['No such column'])
+
+
+def test_passthrough(tmp_path):
+    in_path = tmp_path / 'in.csv'
+    text = ('id,name,score\r\n'
+            '1,"Smith, Al",10\r\n'
+            '2,"multi\nline",20\n'
+            '\n'
+            '3,plain,30\r\n'
+            '4,"quoted ""x""",40')
+    in_path.write_bytes(text.encode('UTF8'))
+    expected = ('id,name,score\r\n'
+                '2,"multi\nline",20\n'
+                '3,plain,30\r\n'
+                '4,"quoted ""x""",40')
+    dct = {'$gt': {'score': 15}}
+    for workers in (1, 2):
+        out_path = tmp_path / 'out.csv'
+        csv_filter = CSV_filter(in_path, out_path, workers=workers, range_size=16,
+                                passthrough=True)
+        assert(csv_filter.stream_filtered_file(dct) == (4, 3))
+        assert(out_path.read_bytes() == expected.encode('UTF8'))
+    counts = CSV_filter(in_path, None, passthrough=True).write_split_files(
+        {tmp_path / 'low.csv': {'$lt': {'score': 15}}, tmp_path / 'high.csv': dct})
+    assert(counts == {tmp_path / 'low.csv': 1, tmp_path / 'high.csv': 3})
+    assert((tmp_path / 'low.csv').read_bytes() == b'id,name,score\r\n1,"Smith, Al",10\r\n')
+    with pytest.raises(ValueError):
+        CSV_filter(in_path, out_path, passthrough=True).stream_filtered_file(dct, ['id'])
+
+
+def test_chunked(tmp_path):
+    dct = {'$or': [{'$gt': {'Data.Wind.Speed': 15}}, {'$re': {'Station.City': '^S'}}]}
+    columns = ['Station.City', 'Data.Wind.Speed']
+    expected_path = tmp_path / 'expected.csv'
+    expected = CSV_filter(IN_FILE, expected_path, use_cache=False).stream_filtered_file(
+        dct, columns)
+    for size in (1, 7, 8192):
+        out_path = tmp_path / 'out.csv'
+        csv_filter = CSV_filter(IN_FILE, out_path, use_cache=False, chunk_size=size)
+        assert(csv_filter.stream_filtered_file(dct, columns) == expected)
+        assert(out_path.read_bytes() == expected_path.read_bytes())
+        csv_filter.write_filtered_file(dct)
+        assert(list(csv.DictReader(open(out_path))) ==
+               apply(dct, csv.DictReader(open(IN_FILE))))
+    with pytest.raises(ValueError):
+        CSV_filter(IN_FILE, OUT_FILE, on_error='skip', chunk_size=8192)
+
+
+def test_write_filtered_file_workers(tmp_path, capsys):
+    dct = {'$lt': {'Data.Temperature.Min Temp': 30}}
+    outputs = {}
+    for workers in (1, 2):
+        out_path = tmp_path / ('out_%d.csv' % workers)
+        csv_filter = CSV_filter(IN_FILE, out_path, workers=workers, range_size=4096)
+        outputs[workers] = csv_filter.write_filtered_file(dct), out_path.read_bytes()
+    assert(outputs[1] == outputs[2])
+    assert(outputs[1][0] == len(apply(dct, csv.DictReader(open(IN_FILE)))) > 0)
+    for workers in (1, 2):
+        out_path = tmp_path / ('none_%d.csv' % workers)
+        csv_filter = CSV_filter(IN_FILE, out_path, workers=workers, range_size=4096)
+        assert(csv_filter.write_filtered_file({'Station.City': 'Nowhere'}) == 0)
+        assert(capsys.readouterr().out == "No records to write.  No file created.\n")
+        assert(not out_path.exists())
+    assert(sorted(os.listdir(tmp_path)) == ['out_1.csv', 'out_2.csv'])
@@ -0,0 +1,75 @@
+from concurrent.futures import ThreadPoolExecutor
+from dicter.expression_cache import Expression_cache, canonical
+from dicter.filter import apply
+from dicter.parser import Parse_error
+import pytest
+
+RECORDS = [
+    {"name": 'Bob', "age": '12', "team": 'ducks'},
+    {"name": 'Sally', "age": '20', "team": 'bears'},
+    {"name": 'Clarence', "age": '30', "team": 'ducks'},
+]
+
+
+def test_canonical():
+    assert(canonical({'name': 'Bob'}) == canonical({'$eq': {'name': 'Bob'}}))
+    assert(canonical({'$and': [{'team': 'ducks'}, {'$gt': {'age': 20}}]}) ==
+           canonical({'$and': [{'$eq': {'team': 'ducks'}}, {'$gt': {'age': 20}}]}))
+    assert(canonical({'$or': [{'a': '1'}, {'$not': {'b': '2'}}]}) !=
+           canonical({'$or': [{'$not': {'b': '2'}}, {'a': '1'}]}))
+    assert(canonical({'$and': [{'a': '1'}, {'b': '2'}]}) !=
+           canonical({'$or': [{'a': '1'}, {'b': '2'}]}))
+    assert(canonical({'a': 1}) != canonical({'a': '1'}))
+    with pytest.raises(Parse_error):
+        canonical({})
+    with pytest.raises(Parse_error):
+        canonical({'$and': [{'a': '1'}]})
+
+
+def test_hits_and_eviction():
+    cache = Expression_cache(maxsize=2)
+    first = cache.compile({'$and': [{'team': 'ducks'}, {'$gt': {'age': 20}}]})
+    assert(cache.compile({'$and': [{'$eq': {'team': 'ducks'}}, {'$gt': {'age': 20}}]}) is first)
+    assert(cache.compile({'$and': [{'team': 'ducks'}, {'$gt': {'age': 20}}]},
+                         on_error='false') is not first)
+    assert([record['name'] for record in RECORDS if first(record)] == ['Clarence'])
+    info = cache.info()
+    # The first compile also parses the dict; the second one hits the parsed entry
+    assert((info['hits'], info['size'], info['maxsize']) == (2, 2, 2))
+    assert(len(cache) == 2)
+    cache.resize(1)
+    assert(len(cache) == 1)
+    cache.clear()
+    assert(cache.info() == {'hits': 0, 'misses': 0, 'size': 0, 'maxsize': 1})
+    disabled = Expression_cache(maxsize=0)
+    disabled.parse({'name': 'Bob'})
+    assert(len(disabled) == 0 and disabled.misses == 1)
+
+
+def test_threads():
+    cache = Expression_cache(maxsize=8)
+    filters = [{'$gt': {'age': i}} for i in range(16)]
+
+    def work(i: int) -> int:
+        predicate = cache.compile(filters[i % 16])
+        return sum(1 for record in RECORDS if predicate(record))
+    with ThreadPoolExecutor(8) as executor:
+        counts = list(executor.map(work, range(2000)))
+    assert(counts == [len(apply(filters[i % 16], RECORDS)) for i in range(2000)])
+    assert(len(cache) <= 8)
+    assert(cache.hits + cache.misses >= 2000)
+
+
+def test_operand_order_is_not_shared():
+    a = {'$and': [{'$gt': {'x': 5}}, {'$lt': {'y': 3}}]}
+    b = {'$and': [{'$lt': {'y': 3}}, {'$gt': {'x': 5}}]}
+    records = [{'x': 'abc', 'y': '5'}]
+    for first, second in ((a, b), (b, a)):
+        cache = Expression_cache()
+        for dct in (first, second):
+            predicate = cache.compile(dct)
+            if dct is a:
+                with pytest.raises(ValueError):
+                    predicate(records[0])
+            else:
+                assert(not predicate(records[0]))
@@ -1,8 +1,11 @@
 import csv
+import pickle
+from concurrent.futures import ProcessPoolExecutor
 from pathlib import Path
+import pytest
 from dicter.stats import Stats
-from dicter.expression import Expression, Match_Type, Term, conj, disj, neg
-from dicter.filter import apply
+from dicter.expression import And, Expression, Interval, Match_Type, Not, Or, Term, adaptive, conj, const, disj, neg
+from dicter.filter import apply, chunks, iapply
 
 FOOBAR = Term("foo", "bar")
 BARBAZ = Term("bar", "baz")
@@ -147,3 +150,158 @@ def test_apply_with_stats():
          }, input_records)
     assert(Stats(filtered_records, 'Data.Temperature.Max Temp').n() == 94)
     assert(Stats(filtered_records, 'Data.Temperature.Min Temp').percentile(90) == 82.0)
+
+
+def test_prepared_operands():
+    assert(FOO_LT.operand == 10.0)
+    assert(FOO_IN.operand == frozenset(["bar", "baz"]))
+    assert(Term("foo", r"\d+", Match_Type.REGEX).operand.match("42"))
+    assert(FOOBAR.operand == "bar")
+
+
+def test_iapply():
+    consumed = []
+
+    def records():
+        for i in range(100):
+            consumed.append(i)
+            yield {"a": str(i)}
+    matches = iapply({'$ge': {'a': 10}}, records(), limit=3)
+    assert(consumed == [])
+    assert([r["a"] for r in matches] == ['10', '11', '12'])
+    assert(len(consumed) == 13)
+    assert(len(list(iapply(FOO_IN, [{"foo": "bar"}, {"foo": "bee"}]))) == 1)
+
+
+def test_adaptive():
+    records = [{"a": str(i), "b": "x" if i % 10 == 0 else "y"} for i in range(200)]
+    rare = Term("b", "x")
+    common = Term("a", 5, Match_Type.GREATER_THAN)
+    exp = adaptive(conj([common, rare]), sample_size=50, recheck_interval=100)
+    assert(apply(exp, records) == apply(conj([common, rare]), records))
+    assert(exp.order[0].term is rare)
+    exp = adaptive(disj([rare, common]), sample_size=50)
+    assert(apply(exp, records) == apply(disj([rare, common]), records))
+    assert(exp.order[0].term is common)
+    # Operands the current order never reaches may fail while sampling
+    exp = adaptive(conj([FOOBAR, Term("n", 1, Match_Type.LESS_THAN)]), sample_size=2)
+    assert(apply(exp, [{"foo": "baz", "n": "?"}, {"foo": "bar", "n": "0"}]) ==
+           [{"foo": "bar", "n": "0"}])
+
+
+def test_adaptive_keeps_guards():
+    # The cheap, selective comparison must not move ahead of its guard
+    records = [{"x": "abc" if i % 2 else str(i)} for i in range(100)]
+    guarded = conj([Expression(Term("x", r"^\d+$", Match_Type.REGEX)),
+                    Expression(Term("x", 90, Match_Type.GREATER_THAN))])
+    exp = adaptive(guarded, sample_size=10, recheck_interval=20)
+    assert(apply(exp, records) == apply(guarded, records) == [{"x": "92"}, {"x": "94"},
+                                                              {"x": "96"}, {"x": "98"}])
+    assert(exp.order[0].term.type == Match_Type.REGEX)
+    unguarded = conj([Expression(Term("x", 90, Match_Type.GREATER_THAN)),
+                      Expression(Term("x", r"^\d+$", Match_Type.REGEX))])
+    with pytest.raises(ValueError):
+        apply(adaptive(unguarded, sample_size=10), records)
+    exp = adaptive(unguarded, sample_size=10, on_error='false')
+    assert(apply(exp, records, on_error='false') == apply(guarded, records))
+
+
+def _matching(expression, records):
+    return [record['foo'] for record in records if expression.matches(record)]
+
+
+def test_nodes_have_slots():
+    exp = conj([Expression(FOOBAR), neg(disj([Expression(BARBAZ), Expression(FOO_IN)]))])
+    assert(isinstance(exp, And))
+    assert(isinstance(exp.operands[1], Not))
+    assert(isinstance(exp.operands[1].operands[0], Or))
+    for node in (exp, exp.operands[0], FOOBAR, const(True)):
+        assert(not hasattr(node, '__dict__'))
+
+
+def test_pickle_round_trip():
+    exp = conj([disj([Expression(FOO_IN), Expression(FOO_SUBSTR)]), neg(Expression(BARBAZ)),
+                Expression(Term('foo', '^b', Match_Type.REGEX)), const(True)])
+    records = [{'foo': 'bar'}, {'foo': 'bar', 'bar': 'baz'}, {'foo': 'everyone'}, {'foo': 'b'}]
+    copy = pickle.loads(pickle.dumps(exp))
+    assert(type(copy) is And)
+    assert(_matching(copy, records) == _matching(exp, records) == ['bar'])
+
+
+def test_pickle_opaque_expression_fails():
+    exp = Expression(None)
+    exp.matches = lambda record: True
+    with pytest.raises(TypeError):
+        pickle.dumps(exp)
+
+
+def test_to_dict():
+    exp = conj([Expression(FOOBAR), neg(disj([Expression(FOO_LT), Expression(FOO_IN)])),
+                const(False)])
+    assert(exp.to_dict() == {'$and': [
+        {'$eq': {'foo': 'bar'}},
+        {'$not': {'$or': [{'$lt': {'foo': 10}}, {'$in': {'foo': ['bar', 'baz']}}]}},
+        {'$false': []}]})
+
+
+def test_ship_to_worker_process():
+    exp = disj([Expression(FOOBAR), Expression(FOO_ENDS_WITH)])
+    records = [{'foo': 'bar'}, {'foo': 'someone'}, {'foo': 'baz'}]
+    with ProcessPoolExecutor(max_workers=1) as executor:
+        assert(executor.submit(_matching, exp, records).result() == ['bar', 'someone'])
+
+
+BATCH_RECORDS = [
+    {'foo': 'bar', 'n': '5'},
+    {'foo': 'baz', 'n': '12.5'},
+    {'foo': 'everyone', 'bar': 'baz'},
+    {'n': '10'},
+    {'foo': 'bar', 'bar': 'baz', 'n': '-3'},
+    {'foo': 'one', 'n': '10'}
+]
+
+
+def test_matches_batch():
+    n_le = Expression(Term('n', 10, Match_Type.LESS_THAN_OR_EQUAL))
+    n_range = Expression(Term('n', Interval(0, 10, True, False), Match_Type.RANGE))
+    opaque = Expression(None)
+    opaque.matches = lambda record: len(record) == 2
+    exps = [Expression(FOOBAR), Expression(FOO_IN), Expression(FOO_ENDS_WITH),
+            Expression(Term('foo', 'b.r', Match_Type.REGEX)), n_le, n_range, opaque,
+            conj([Expression(FOO_IN), n_le]), disj([Expression(BARBAZ), n_range]),
+            neg(conj([disj([Expression(FOOBAR), opaque]), neg(n_le)])), const(True), const(False)]
+    for exp in exps:
+        expected = [bool(exp.matches(record)) for record in BATCH_RECORDS]
+        assert(exp.matches_batch(BATCH_RECORDS).tolist() == expected)
+    assert(FOO_IN.matches_batch(BATCH_RECORDS).tolist() == [True, True, False, False, True, False])
+
+
+def test_matches_batch_short_circuits():
+    records = [{'a': 'x', 'n': 'not a number'}, {'a': 'y', 'n': '1'}]
+    n_lt = Expression(Term('n', 5, Match_Type.LESS_THAN))
+    assert(conj([Expression(Term('a', 'y')), n_lt]).matches_batch(records).tolist() ==
+           [False, True])
+    assert(disj([Expression(Term('a', 'x')), n_lt]).matches_batch(records).tolist() ==
+           [True, True])
+    with pytest.raises(ValueError):
+        n_lt.matches_batch(records)
+
+
+def test_matches_batch_fields():
+    fields = {'foo': 0, 'n': 1}
+    rows = [['bar', '5'], ['baz', '12'], ['everyone', None]]
+    exp = disj([conj([Expression(FOO_IN), Expression(Term('n', 10, Match_Type.LESS_THAN))]),
+                Expression(FOO_ENDS_WITH), Expression(Term('missing', 'x'))])
+    assert(exp.matches_batch(rows, fields).tolist() == [True, False, True])
+
+
+def test_apply_chunked():
+    exp = {'$or': [{'foo': 'bar'}, {'$gt': {'n': 11}}]}
+    expected = apply(exp, BATCH_RECORDS)
+    assert(len(expected) == 3)
+    for size in (1, 2, 4, 100):
+        assert(apply(exp, BATCH_RECORDS, chunk_size=size) == expected)
+        assert(apply(exp, iter(BATCH_RECORDS), chunk_size=size) == expected)
+    assert([len(chunk) for chunk in chunks(range(10), 4)] == [4, 4, 2])
+    with pytest.raises(ValueError):
+        apply(exp, BATCH_RECORDS, on_error='false', chunk_size=2)
@@ -0,0 +1,60 @@
+import csv
+from pathlib import Path
+from dicter.filter import apply
+from dicter.index import Indexed_recordset
+
+SAMPLE_DATA_DIR = Path(__file__).resolve().parent.parent / 'examples'
+IN_FILE = SAMPLE_DATA_DIR / 'weather.csv'
+
+FILTERS = [
+    {'Station.State': 'Arizona'},
+    {'$in': {'Station.State': ['Arizona', 'Nevada']}},
+    {'$and': [{'$gt': {'Data.Temperature.Max Temp': 100}}, {'$le': {'Data.Wind.Speed': 5}}]},
+    {'$and': [{'$or': [{'$gt': {'Data.Temperature.Max Temp': 100}},
+                       {'$gt': {'Data.Temperature.Min Temp': 80}}]},
+              {'$not': {'Station.State': 'Arizona'}}]},
+    {'$and': [{'Station.State': 'Texas'}, {'$re': {'Station.City': 'S'}}]},
+    {'$or': [{'Station.State': 'Alaska'}, {'$startswith': {'Station.City': 'Y'}}]},
+    {'$and': [{'$lt': {'Data.Temperature.Max Temp': 0}},
+              {'$gt': {'Data.Temperature.Max Temp': 10}}]},
+]
+
+
+def test_indexed_apply():
+    records = list(csv.DictReader(open(IN_FILE)))
+    indexed = Indexed_recordset(records[:1000], hash_keys=['Station.State'],
+                                sorted_keys=['Data.Temperature.Max Temp',
+                                             'Data.Temperature.Min Temp'])
+    indexed.extend(records[1000:])
+    indexed.append({'Station.State': 'Arizona'})
+    records.append({'Station.State': 'Arizona'})
+    assert(len(indexed) == len(records))
+    for dct in FILTERS:
+        assert(indexed.apply(dct) == apply(dct, records))
+
+
+def test_unusable_sorted_index():
+    records = [{'a': '1'}, {'a': 'n/a'}, {'a': '3'}, {'b': '4'}]
+    indexed = Indexed_recordset(records, sorted_keys=['a'])
+    assert(indexed.apply({'$gt': {'a': 2}}, on_error='false') == [{'a': '3'}])
+    assert(indexed.apply({'$not': {'$gt': {'a': 2}}}, on_error='false') == records[:2] + records[3:])
+
+
+def test_append_between_queries():
+    records = [{'a': str((i * 37) % 101), 'b': 'xy'[i % 2]} for i in range(1000)]
+    indexed = Indexed_recordset(records[:500], sorted_keys=['a'])
+    dct = {'$and': [{'$ge': {'a': 40}}, {'$lt': {'a': 60}}, {'$re': {'b': 'x'}}]}
+    for i in range(500, 1000, 7):
+        indexed.extend(records[i:i + 7])
+        assert(indexed.apply(dct) == apply(dct, records[:i + 7]))
+
+
+def test_unbounded_lookup_keeps_infinities():
+    records = [{'x': '-inf'}, {'x': '3'}, {'x': 'inf'}, {'x': 'nan'}]
+    indexed = Indexed_recordset(records, sorted_keys=['x'])
+    for dct in [{'$lt': {'x': 5}}, {'$le': {'x': 3}}, {'$gt': {'x': 1}}, {'$ge': {'x': 3}},
+                {'$range': {'x': [None, None]}}, {'$range': {'x': [None, 20, False, True]}},
+                {'$lt': {'x': float('inf')}}, {'$gt': {'x': float('-inf')}}]:
+        assert(indexed.apply(dct) == apply(dct, records))
+    assert(indexed.apply({'$lt': {'x': 5}}) == records[:2])
+    assert(indexed.apply({'$gt': {'x': 1}}) == records[1:3])
@@ -0,0 +1,42 @@
+from dicter.filter import apply
+from dicter.instrument import instrument
+from dicter.table import Table
+
+RECORDS = [
+    {"name": 'Bob', "age": '12', "team": 'ducks'},
+    {"name": 'Sally', "age": '20', "team": 'bears'},
+    {"name": 'Clarence', "age": '30', "team": 'ducks'},
+    {"name": 'Maddie', "age": '40'},
+]
+
+DCT = {'$and': [
+    {'$re': {'name': '[A-Z]a'}},
+    {'$or': [{'$gt': {'age': 25}}, {'$not': {'team': 'bears'}}]}
+]}
+
+
+def test_counts_and_pass_rates():
+    profiled = instrument(DCT, sample_interval=2)
+    assert(apply(profiled, RECORDS) == apply(DCT, RECORDS))
+    profile = profiled.to_dict()
+    assert(profile['node'] == '$and')
+    assert((profile['evaluations'], profile['passes']) == (4, 1))
+    regex, disjunction = profile['children']
+    assert(regex['node'] == "$re 'name' '[A-Z]a'")
+    assert((regex['evaluations'], regex['passes']) == (4, 2))
+    assert((disjunction['evaluations'], disjunction['passes']) == (2, 1))
+    greater, negation = disjunction['children']
+    assert(greater['node'] == "$gt 'age' 25.0")
+    assert((greater['evaluations'], greater['passes']) == (2, 1))
+    assert((negation['evaluations'], negation['passes']) == (1, 0))
+    assert(regex['samples'] == 2 and regex['time'] > 0)
+    assert(profiled.report().splitlines()[2].startswith('  $or  evaluated 2  passed 1'))
+    profiled.reset()
+    assert(profiled.to_dict()['evaluations'] == 0)
+
+
+def test_table_evaluates_instrumented_expression():
+    profiled = instrument(DCT)
+    table = Table.from_records(RECORDS)
+    assert(list(table.where(profiled)) == apply(DCT, RECORDS))
+    assert(profiled.to_dict()['evaluations'] == 4)
@@ -0,0 +1,73 @@
+from pathlib import Path
+from dicter.csv_filter import CSV_filter
+from dicter.mmap_reader import Mmap_reader, required_literals
+from dicter.parser import parse
+import pytest
+
+WEATHER_FILE = Path(__file__).resolve().parent.parent / 'examples' / 'weather.csv'
+
+TEXT = ('id,name,score\r\n'
+        '1,"Smith, Al",10\r\n'
+        '2,"multi\nline",20\n'
+        '\n'
+        '3,plain,30\r\n'
+        '4,"quoted ""x""",40')
+
+
+def test_required_literals():
+    assert(required_literals(parse({'name': 'Bob'})) == [(b'Bob',)])
+    assert(required_literals(parse({'$and': [{'$gt': {'age': 3}}, {'$startswith': {'name': 'B'}}]}))
+           == [(b'B',)])
+    assert(required_literals(parse({'$or': [{'name': 'Bob'}, {'$in': {'team': ['ducks']}}]}))
+           == [(b'Bob', b'ducks')])
+    assert(required_literals(parse({'$or': [{'name': 'Bob'}, {'$gt': {'age': 3}}]})) == [])
+    assert(required_literals(parse({'$not': {'name': 'Bob'}})) == [])
+    assert(required_literals(parse({'name': 'say "hi"'})) == [])
+
+
+def test_ranges(tmp_path):
+    path = tmp_path / 'in.csv'
+    path.write_bytes(TEXT.encode('UTF8'))
+    with Mmap_reader(path) as reader:
+        assert(reader.field_names == ['id', 'name', 'score'])
+        assert(bytes(reader.header()) == b'id,name,score\r\n')
+        views = list(reader.ranges({'$gt': {'score': 15}}))
+        assert([bytes(view) for view in views] ==
+               [b'2,"multi\nline",20\n', b'3,plain,30\r\n4,"quoted ""x""",40'])
+        assert((reader.rows_read, reader.rows_written) == (4, 3))
+        views = list(reader.ranges({'name': 'plain'}))
+        assert([bytes(view) for view in views] == [b'3,plain,30\r\n'])
+        del views
+    empty = tmp_path / 'empty.csv'
+    empty.write_bytes(b'')
+    with Mmap_reader(empty) as reader:
+        assert(reader.field_names is None)
+        assert(list(reader.ranges({'name': 'plain'})) == [])
+
+
+@pytest.mark.parametrize('dct', [
+    {'Station.State': 'Arizona'},
+    {'$and': [{'$in': {'Station.City': ['Phoenix', 'Tucson', 'Reno']}},
+              {'$gt': {'Data.Temperature.Max Temp': 90}}]},
+    {'$or': [{'$startswith': {'Station.City': 'San'}}, {'$lt': {'Data.Wind.Speed': 2}}]}
+])
+def test_memory_map_filter(tmp_path, dct):
+    expected_path = tmp_path / 'expected.csv'
+    out_path = tmp_path / 'out.csv'
+    expected = CSV_filter(WEATHER_FILE, expected_path, passthrough=True).stream_filtered_file(dct)
+    assert(CSV_filter(WEATHER_FILE, out_path, memory_map=True).stream_filtered_file(dct)
+           == expected)
+    assert(out_path.read_bytes() == expected_path.read_bytes())
+
+
+def test_block_boundaries(tmp_path, monkeypatch):
+    import dicter.mmap_reader
+    path = tmp_path / 'in.csv'
+    path.write_bytes(TEXT.encode('UTF8'))
+    for block_size in (1, 7, 16, 1 << 20):
+        monkeypatch.setattr(dicter.mmap_reader, 'SCAN_BLOCK_SIZE', block_size)
+        with Mmap_reader(path) as reader:
+            assert(reader.field_names == ['id', 'name', 'score'])
+            text = b''.join(bytes(view) for view in reader.ranges({'$lt': {'score': 35}}))
+            assert(text == b'1,"Smith, Al",10\r\n2,"multi\nline",20\n3,plain,30\r\n')
+            assert((reader.rows_read, reader.rows_written) == (4, 3))
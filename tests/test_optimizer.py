@@ -0,0 +1,84 @@
+from dicter.expression import Match_Type, Term
+from dicter.filter import apply
+from dicter.optimizer import optimize
+from dicter.parser import parse
+from dicter.table import Table
+
+RECORDS = [
+    {"name": 'Bob', "age": '12', "weight": '100', "team": 'ducks'},
+    {"name": 'Sally', "age": '20', "weight": '110', "team": 'bears'},
+    {"name": 'Clarence', "age": '30', "weight": '175', "team": 'ducks'},
+    {"name": 'Maddie', "age": '40', "weight": '135'},
+    {"name": 'Poo', "age": '50', "weight": '180', "team": 'bears'}
+]
+
+
+def matching(expression):
+    return [record for record in RECORDS if expression.matches(record)]
+
+
+def test_range_merge():
+    dct = {'$and': [{'$gt': {'age': 15}}, {'$and': [{'$le': {'age': 40}}, {'$lt': {'age': 45}}]},
+                    {'$re': {'name': '.*a'}}]}
+    exp = optimize(dct)
+    assert(exp.op == '$and')
+    assert(len(exp.operands) == 2)
+    term = exp.operands[0].term
+    assert(term.type == Match_Type.RANGE)
+    assert(term.operand.as_tuple() == (15.0, 40.0, False, True))
+    assert(exp.operands[1].term.type == Match_Type.REGEX)
+    assert(matching(exp) == apply(dct, RECORDS))
+
+
+def test_contradiction():
+    exp = optimize({'$and': [{'$lt': {'age': 5}}, {'team': 'ducks'}, {'$gt': {'age': 10}}]})
+    assert(exp.op == '$false')
+    exp = optimize({'$or': [{'name': 'Bob'},
+                            {'$not': {'$and': [{'$lt': {'age': 5}}, {'$gt': {'age': 10}}]}}]})
+    assert(exp.op == '$true')
+    assert(matching(exp) == RECORDS)
+
+
+def test_equals_to_in():
+    dct = {'$or': [{'$re': {'name': 'C'}}, {'name': 'Bob'}, {'$in': {'name': ['Poo', 'Zed']}},
+                   {'$gt': {'age': 45}}, {'name': 'Sally'}]}
+    exp = optimize(dct)
+    assert([operand.term.type for operand in exp.operands] ==
+           [Match_Type.IN, Match_Type.REGEX, Match_Type.GREATER_THAN])
+    assert(exp.operands[0].term.operand == frozenset(['Bob', 'Poo', 'Zed', 'Sally']))
+    assert(matching(exp) == apply(dct, RECORDS))
+
+
+def test_double_negation_and_duplicates():
+    exp = optimize({'$not': {'$not': {'$and': [{'team': 'ducks'}, {'team': 'ducks'}]}}})
+    assert(exp.op is None)
+    assert(exp.term.key == 'team')
+    original = parse({'$or': [{'$not': {'$not': {'team': 'bears'}}}, {'$lt': {'age': 20}}]})
+    assert(matching(optimize(original)) == matching(original))
+    assert(optimize(Term('age', 20, Match_Type.LESS_THAN)).term.type == Match_Type.LESS_THAN)
+
+
+def test_guards_keep_their_order():
+    dct = {'$and': [{'$re': {'x': r'^\d+$'}}, {'$gt': {'x': 5}}]}
+    records = [{'x': 'abc'}, {'x': '7'}]
+    assert([operand.term.type for operand in optimize(dct).operands] ==
+           [Match_Type.REGEX, Match_Type.GREATER_THAN])
+    assert(apply(dct, records) == [{'x': '7'}])
+    dct = {'$or': [{'$not': {'$re': {'x': r'^\d+$'}}}, {'$lt': {'x': 5}}, {'x': 'abc'}]}
+    exp = optimize(dct)
+    assert(exp.operands[0].term.type == Match_Type.EQUALS)
+    assert(apply(dct, records) == [{'x': 'abc'}])
+
+
+def test_merged_ranges_keep_infinities():
+    records = [{'x': '-inf'}, {'x': 'inf'}, {'x': '3'}, {'x': 'nan'}]
+    for dct, expected in [({'$and': [{'$lt': {'x': 5}}, {'$lt': {'x': 10}}]}, ['-inf', '3']),
+                          ({'$and': [{'$gt': {'x': 5}}, {'$gt': {'x': 1}}]}, ['inf']),
+                          ({'$range': {'x': [None, None]}}, ['-inf', 'inf', '3']),
+                          ({'$lt': {'x': float('inf')}}, ['-inf', '3'])]:
+        exp = optimize(dct)
+        assert([r['x'] for r in apply(dct, records)] == expected)
+        assert([r['x'] for r in records if exp.matches(r)] == expected)
+        assert([r['x'] for r, hit in zip(records, exp.matches_batch(records)) if hit] ==
+               expected)
+        assert([r['x'] for r in Table.from_records(records).where(exp)] == expected)
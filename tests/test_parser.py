@@ -1,5 +1,8 @@
+import json
+import pytest
 from dicter.filter import apply
-from dicter.parser import parse
+from dicter.optimizer import optimize
+from dicter.parser import Parse_error, from_json, parse, to_json
 
 TEST_RECORDS = [
     {"name": 'Bob', "age": '12', "weight": '100', "team": 'ducks'},
@@ -100,3 +103,59 @@ def test_more_than_2_disjuncts():
          ]
          }, TEST_RECORDS)
     assert(len(recs) == 5)
+
+
+def test_invalid_operands():
+    for exp_str in [{'$re': {'name': '(unclosed'}},
+                    {'$lt': {'age': 'twenty'}},
+                    {'$feq': {'age': None}}]:
+        with pytest.raises(Parse_error):
+            parse(exp_str)
+
+
+def test_constants():
+    assert(len(apply(parse({'$true': []}), TEST_RECORDS)) == 5)
+    assert(apply(parse({'$false': []}), TEST_RECORDS) == [])
+
+
+def test_to_dict_round_trip():
+    exps = [
+        {'$and': [{'$gt': {'age': 15}}, {'$not': {'team': 'ducks'}}]},
+        {'$or': [{'$re': {'name': '^[SP]'}}, {'$in': {'team': ['ducks', 'aminals']}}]},
+        {'$and': [{'$ge': {'age': 20}}, {'$lt': {'age': 45}}, {'$substr': {'name': 'a'}}]}
+    ]
+    for exp in exps:
+        expected = apply(parse(exp), TEST_RECORDS)
+        assert(apply(parse(parse(exp).to_dict()), TEST_RECORDS) == expected)
+        # Optimized expressions contain ranges and constants
+        assert(apply(parse(optimize(exp).to_dict()), TEST_RECORDS) == expected)
+
+
+def test_json_wire_format():
+    exp = {'$and': [{'$gt': {'age': 15}}, {'$not': {'$eq': {'team': 'ducks'}}}]}
+    text = to_json(parse(exp))
+    assert(' ' not in text)
+    assert(text == to_json(exp) ==
+           '{"$and":[{"$gt":{"age":15}},{"$not":{"$eq":{"team":"ducks"}}}]}')
+    assert(apply(from_json(text), TEST_RECORDS) == apply(parse(exp), TEST_RECORDS))
+    with pytest.raises(Parse_error):
+        from_json('{"$and": [')
+    with pytest.raises(Parse_error):
+        from_json('[1, 2]')
+
+
+def test_json_open_ranges():
+    def reject(constant):
+        raise ValueError("Not strict JSON: " + constant)
+    exp = optimize({'$or': [{'$gt': {'age': 25}}, {'$and': [{'$ge': {'age': 10}},
+                                                          {'$lt': {'age': 15}}]}]})
+    text = to_json(exp)
+    assert(json.loads(text, parse_constant=reject) == {'$or': [
+        {'$gt': {'age': 25.0}}, {'$range': {'age': [10.0, 15.0, True, False]}}]})
+    assert(apply(from_json(text), TEST_RECORDS) == apply(exp, TEST_RECORDS))
+    text = to_json(parse({'$range': {'age': [None, 20, False, True]}}))
+    assert(json.loads(text, parse_constant=reject) ==
+           {'$range': {'age': [None, 20.0, False, True]}})
+    assert([r['name'] for r in apply(from_json(text), TEST_RECORDS)] == ['Bob', 'Sally'])
+    with pytest.raises(ValueError):
+        to_json({'$lt': {'age': float('inf')}})
@@ -1,6 +1,13 @@
-from dicter.stats import Stats
+import csv
+from pathlib import Path
+from dicter.filter import apply
+from dicter.stats import Stats, Streaming_stats, group_by
+from dicter.table import Table
 import pytest
 
+SAMPLE_DATA_DIR = Path(__file__).resolve().parent.parent / 'examples'
+IN_FILE = SAMPLE_DATA_DIR / 'weather.csv'
+
 RECORDS = [
     {"a": '10', "b": '100', "c": '1000'},
     {"a": '20', "b": '200', "c": '2000'},
@@ -42,3 +49,93 @@ def test_max():
 def test_n():
     stats = Stats(RECORDS, 'b')
     assert(stats.n() == 5)
+
+
+def test_cached_data():
+    records = [dict(r) for r in RECORDS]
+    stats = Stats(iter(records), "a")
+    assert(stats.n() == 5)
+    assert(stats.mean() == 30)  # iterator already consumed - cache is used
+    stats.records = records + [{"a": '60'}]
+    assert(stats.n() == 5)
+    stats.invalidate()
+    assert(stats.n() == 6)
+
+
+def test_summary():
+    stats = Stats(RECORDS, "b")
+    summary = stats.summary()
+    assert(summary['n'] == 5)
+    assert(summary['sum'] == 1500)
+    assert(summary['mean'] == 300)
+    assert(summary['min'] == 100)
+    assert(summary['max'] == 500)
+    assert(summary['std'] == pytest.approx(stats.std()))
+    assert(summary['median'] == 300)
+    assert(summary['percentiles'] == stats.percentiles())
+
+
+def test_group_by():
+    records = list(csv.DictReader(open(IN_FILE)))
+    dct = {'$gt': {'Data.Wind.Speed': 5}}
+    aggregations = {'Data.Temperature.Max Temp': ['count', 'sum', 'mean', 'min', 'max',
+                                                  'std', 'median', 'p90', 'percentiles'],
+                    'Data.Wind.Speed': ['mean']}
+    groups = group_by(records, 'Station.State', aggregations, dct)
+    table_groups = group_by(Table.from_records(records), 'Station.State', aggregations, dct)
+    assert(list(groups) == list(table_groups))
+    filtered = apply(dct, records)
+    assert(sum(g['Data.Temperature.Max Temp']['count'] for g in groups.values()) == len(filtered))
+    for state, group in groups.items():
+        stats = Stats(apply({'Station.State': state}, filtered), 'Data.Temperature.Max Temp')
+        max_temp = group['Data.Temperature.Max Temp']
+        assert(max_temp == table_groups[state]['Data.Temperature.Max Temp'])
+        assert(max_temp['count'] == stats.n())
+        assert(max_temp['sum'] == pytest.approx(stats.sum()))
+        assert(max_temp['mean'] == pytest.approx(stats.mean()))
+        assert(max_temp['min'] == stats.min())
+        assert(max_temp['max'] == stats.max())
+        assert(max_temp['std'] == pytest.approx(stats.std()))
+        assert(max_temp['median'] == pytest.approx(stats.median()))
+        assert(max_temp['p90'] == pytest.approx(stats.percentile(90)))
+        assert(max_temp['percentiles'] == pytest.approx(stats.percentiles()))
+
+
+def test_group_by_multiple_keys():
+    records = [{'a': 'x', 'b': '1', 'v': '1'}, {'a': 'x', 'b': '2', 'v': '2'},
+               {'a': 'x', 'b': '1', 'v': '3'}, {'a': 'y', 'b': '1', 'v': '4'}]
+    groups = group_by(records, ['a', 'b'], {'v': ['n', 'sum']})
+    assert(groups == {('x', '1'): {'v': {'n': 2, 'sum': 4}},
+                      ('x', '2'): {'v': {'n': 1, 'sum': 2}},
+                      ('y', '1'): {'v': {'n': 1, 'sum': 4}}})
+
+
+def test_streaming_stats_exact():
+    stats = Streaming_stats("b").update(iter(RECORDS))
+    exact = Stats(RECORDS, "b")
+    assert(stats.n() == 5)
+    assert(stats.sum() == 1500)
+    assert(stats.min() == 100)
+    assert(stats.max() == 500)
+    assert(stats.mean() == pytest.approx(exact.mean()))
+    assert(stats.std() == pytest.approx(exact.std()))
+    assert(stats.percentiles() == exact.percentiles())
+
+
+def test_streaming_stats_merge():
+    values = [(i * 7919) % 10007 for i in range(20000)]
+    parts = [Streaming_stats(k=100, seed=i) for i in range(3)]
+    for i, value in enumerate(values):
+        parts[i % 3].add(value)
+    merged = parts[0].merge(parts[1]).merge(parts[2])
+    exact = Stats([{"v": v} for v in values], "v")
+    assert(merged.n() == len(values))
+    assert(merged.mean() == pytest.approx(exact.mean()))
+    assert(merged.std() == pytest.approx(exact.std()))
+    assert(merged.min() == exact.min())
+    assert(merged.max() == exact.max())
+    assert(sum(len(c) for c in merged.sketch.compactors) < 1000)
+    for q in [5, 25, 50, 75, 95]:
+        estimate = merged.percentile(q)
+        rank = sum(v < estimate for v in values) / len(values) * 100
+        assert(abs(rank - q) < 5)
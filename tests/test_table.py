@@ -0,0 +1,83 @@
+import csv
+from pathlib import Path
+from dicter.filter import apply
+from dicter.parser import parse
+from dicter.stats import Stats
+from dicter.table import Table
+
+SAMPLE_DATA_DIR = Path(__file__).resolve().parent.parent / 'examples'
+IN_FILE = SAMPLE_DATA_DIR / 'weather.csv'
+
+RECORDS = [
+    {"name": 'Bob', "age": '12', "weight": '100', "team": 'ducks'},
+    {"name": 'Sally', "age": '20', "weight": '110', "team": 'bears'},
+    {"name": 'Clarence', "age": '30', "weight": '175', "team": 'ducks'},
+    {"name": 'Maddie', "age": '40', "weight": '135'},
+    {"name": 'Poo', "age": '50', "weight": '180', "team": 'bears'}
+]
+
+FILTERS = [
+    {'team': 'bears'},
+    {'$lt': {'age': 25}},
+    {'$not': {'team': 'ducks'}},
+    {'$and': [{'$or': [{'$gt': {'age': 20}}, {'$gt': {'weight': 105}}]},
+              {'$not': {'team': 'aminals'}}]},
+    {'$in': {'team': ['ducks', 'geese']}},
+    {'$re': {'name': r'[A-Z]a'}},
+    {'$startswith': {'name': 'C'}},
+    {'$feq': {'weight': 135}},
+    {'$eq': {'color': 'red'}},
+]
+
+
+def test_mask_matches_apply():
+    table = Table.from_records(RECORDS)
+    assert(len(table) == 5)
+    for dct in FILTERS:
+        expected = apply(dct, RECORDS)
+        assert(list(table.where(dct)) == expected)
+        assert(list(table.where(parse(dct))) == expected)
+
+
+def test_csv_stats():
+    table = Table.from_csv(IN_FILE)
+    dct = {'$and':
+           [
+               {'$or': [
+                   {'$gt': {'Data.Temperature.Max Temp': 100}},
+                   {'$gt': {'Data.Temperature.Min Temp': 80}}
+               ]},
+               {'$not': {'Station.State': 'Arizona'}}
+           ]}
+    hot = table.where(dct)
+    assert(Stats(hot, 'Data.Temperature.Max Temp').n() == 94)
+    assert(Stats(hot, 'Data.Temperature.Min Temp').percentile(90) == 82.0)
+    assert(list(hot) == apply(dct, csv.DictReader(open(IN_FILE))))
+
+
+def test_stats_skip_missing():
+    table = Table.from_records(RECORDS + [{"name": 'Nobody'}])
+    assert(Stats(table, 'age').n() == 5)
+    assert(Stats(table, 'age').sum() == 152)
+
+
+def test_encoded_columns():
+    table = Table.from_records(RECORDS)
+    codes, values = table.encoded('team')
+    assert(list(values) == ['ducks', 'bears'])
+    assert(list(codes) == [0, 1, 0, -1, 1])
+    dct = {'$or': [{'$endswith': {'team': 'cks'}}, {'$re': {'name': 'M'}}]}
+    expected = apply(dct, RECORDS)
+    assert(list(table.where(dct)) == expected)
+    ducks = table.where({'$startswith': {'team': 'd'}})
+    assert(list(ducks.encoded('team')[0]) == [0, 0])
+    assert(list(ducks.where({'$re': {'team': 'du'}})) == apply({'team': 'ducks'}, RECORDS))
+
+
+def test_csv_blank_lines(tmp_path):
+    path = tmp_path / 'blank.csv'
+    path.write_text('name,n\nBob,1\n\nSally,2\n\n')
+    table = Table.from_csv(path)
+    assert(list(table) == list(csv.DictReader(open(path))))
+    assert(len(table) == 2)
+    assert(Stats(table, 'n').n() == 2)